@@ -1,5 +1,33 @@
 import os
-import requests
+import re
+import json
+import asyncio
+import logging
+import time
+import aiohttp
+from email.utils import parsedate_to_datetime
+from http.cookies import SimpleCookie
+from yarl import URL
+
+from api_transport import ApiError, ApiUnavailableError, CircuitBreaker, RequestBudget, get_retry_delay, \
+    parse_retry_after
+from match_parser import loads
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+API_LATENCY = registry.histogram("wz_api_request_seconds", "Warzone API request latency, per attempt",
+                                 ("endpoint", "status"))
+API_RETRIES = registry.counter("wz_api_retries_total", "Warzone API requests retried after a transient failure",
+                               ("endpoint",))
+
+# set by the login page, and needed for every API request after it
+XSRF_COOKIE = "XSRF-TOKEN"
+# how long an xsrf token that came without an expiry (a browser session cookie) is reused for
+SESSION_COOKIE_LIFETIME = 12 * 60 * 60
+
+# successful responses start with their status, so it can usually be checked without decoding the whole body
+SUCCESS_STATUS = re.compile(rb'^\s*\{\s*"status"\s*:\s*"success"')
 
 # original method would make a POST request to COD site login to set atkn and sso cookies
 # this method now fails because Activision added a recaptcha to the login
@@ -8,47 +36,304 @@ import requests
 
 
 class WarzoneApi():
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, cache=None, max_concurrency=4, max_retries=3, max_retry_wait=60, hourly_budget=600,
+                 cookie_path=None):
         self.atkn = os.getenv("atkn")
         self.sso = os.getenv("ACT_SSO_COOKIE")
         self.base_url = "https://my.callofduty.com/api/papi-client/"
+        self.login_url = "https://profile.callofduty.com/cod/login"
 
         # requests will timeout otherwise
         self.user_agent_header = {
             "User-Agent": "Chrome/104.0.0.0"
         }
 
-        # sets xsrf token cookie for future requests
-        self.session.get('https://profile.callofduty.com/cod/login')
+        # aiohttp sessions have to be created inside the running event loop, so the session (and the xsrf login
+        # request) is deferred until the first API call. the cookie jar is saved to cookie_path so a restart can
+        # skip the login request entirely while the xsrf token is still valid. aiohttp doesn't save when cookies
+        # expire, so the token's expiry is saved next to the jar
+        self.session = None
+        self.cookie_path = cookie_path
+        self.xsrf_expires = None  # epoch seconds
+        self.auth_expired = False
+        self.logins = 0
+        self.cache = cache  # optional MatchCache
+        self.max_concurrency = max_concurrency
+        self._session_lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
 
-        if self.atkn is None or self.sso is None:
-            raise RuntimeError("atkn and sso cookies must be set in .env by logging in on web browser")
-        else:
-            self.session.cookies.set("atkn", self.atkn, domain=".callofduty.com")
-            self.session.cookies.set("ACT_SSO_COOKIE", self.sso, domain=".callofduty.com")
+        # transient failures are retried up to max_retries times, unless the API asks us to wait longer than
+        # max_retry_wait. repeated failures open the circuit breaker, which pauses all requests for a while
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        self.breaker = CircuitBreaker()
+        self.budget = RequestBudget(hourly_budget)
+        self.retries = 0
+        # optional replay.ApiRecorder that gets every response the API methods return, cached ones included
+        self.recorder = None
 
-    # collect Warzone matches played in the last week.
-    # start and end parameters don't actually work as expected
-    def get_matches(self, username):
-        req_url = f"crm/cod/v2/title/mw/platform/uno/gamer/{username}/matches/wz/start/0/end/0/details"
-        api_data = self._wz_api_call(req_url)
-        return api_data["data"]["matches"]
+    # collect the most recent Warzone matches (up to 20).
+    # the start parameter doesn't work as expected, but end (a timestamp in milliseconds) can be used to page back
+    # through history: the API returns the matches played before it. end=0 means the latest matches
+    async def get_matches(self, username, end=0):
+        req_url = f"crm/cod/v2/title/mw/platform/uno/gamer/{username}/matches/wz/start/0/end/{int(end)}/details"
+        if self.cache is not None and end == 0:
+            matches = self.cache.get_matches(username)
+            if matches is not None:
+                if self.recorder is not None:
+                    self.recorder.record(req_url, json.dumps({"status": "success", "data": {"matches": matches}}).encode())
+                return matches
+
+        raw = await self._wz_api_request(req_url)
+        if self.recorder is not None:
+            self.recorder.record(req_url, raw)
+        api_data = loads(raw)
+        matches = api_data["data"]["matches"]
+
+        if self.cache is not None and end == 0:
+            self.cache.put_matches(username, matches)
+        return matches
 
     # use match ID to get more detailed data/stats
-    def get_match_details(self, match_id):
+    async def get_match_details(self, match_id):
+        return loads(await self.get_match_details_raw(match_id))["data"]["allPlayers"]
+
+    # undecoded fullMatch response body. the tracker pipeline parses it (see match_parser.parse_team_rows)
+    async def get_match_details_raw(self, match_id):
+        # finished matches never change, so a cached copy is always good
         req_url = f"crm/cod/v2/title/mw/platform/uno/fullMatch/wz/{match_id}/en"
-        api_data = self._wz_api_call(req_url)
-        return api_data["data"]["allPlayers"]
+        raw = self.cache.get_match_details(match_id) if self.cache is not None else None
+        if raw is not None:
+            if self.recorder is not None:
+                self.recorder.record(req_url, raw)
+            return raw
+
+        raw = await self._wz_api_request(req_url)
+        if self.recorder is not None:
+            self.recorder.record(req_url, raw)
+
+        if self.cache is not None:
+            self.cache.put_match_details(match_id, raw)
+        return raw
+
+    # seconds until requests will be allowed again (circuit breaker open or budget used up), 0 if they are now
+    def get_retry_after(self):
+        return max(self.breaker.get_retry_after(), self.budget.get_retry_after())
+
+    def get_status(self):
+        return {
+            "circuit": self.breaker.state,
+            "last_error": self.breaker.last_error,
+            "requests_last_hour": self.budget.get_used(),
+            "hourly_budget": self.budget.per_hour,
+            "retries": self.retries,
+            "logins": self.logins
+        }
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def _get_session(self):
+        async with self._session_lock:
+            xsrf_expired = self.xsrf_expires is None or time.time() >= self.xsrf_expires
+            if self.session is not None and not self.session.closed and not self.auth_expired and not xsrf_expired:
+                return self.session
+
+            if self.atkn is None or self.sso is None:
+                raise RuntimeError("atkn and sso cookies must be set in .env by logging in on web browser")
+
+            # the API rejected our cookies - start over with a fresh login instead of the saved jar
+            if self.auth_expired:
+                logger.info("Warzone API auth expired. Logging in again.")
+                if self.session is not None:
+                    await self.session.close()
+                self.session = None
+                self._delete_cookies()
+                self.auth_expired = False
+            elif self.session is not None:
+                logger.info("Warzone API xsrf token expired. Logging in again.")
+                await self.session.close()
+                self.session = None
+
+            cookie_jar = aiohttp.CookieJar()
+            self._load_cookies(cookie_jar)
+
+            # one pooled keep-alive connection per concurrent request slot
+            connector = aiohttp.TCPConnector(limit_per_host=self.max_concurrency, keepalive_timeout=60)
+            session = aiohttp.ClientSession(connector=connector,
+                                            cookie_jar=cookie_jar,
+                                            headers=self.user_agent_header,
+                                            timeout=aiohttp.ClientTimeout(total=30))
+
+            logged_in = False
+            try:
+                # sets xsrf token cookie for future requests, unless a saved one is still good to use
+                xsrf_expired = self.xsrf_expires is None or time.time() >= self.xsrf_expires
+                if xsrf_expired or XSRF_COOKIE not in cookie_jar.filter_cookies(URL(self.login_url)):
+                    async with session.get(self.login_url) as resp:
+                        await resp.read()
+                        self.xsrf_expires = _get_cookie_expiry(resp.cookies.get(XSRF_COOKIE))
+                    self.logins += 1
+
+                # the auth cookies always come from .env, so updating them there takes effect on the next login
+                auth_cookies = SimpleCookie()
+                for cookie_name, value in (("atkn", self.atkn), ("ACT_SSO_COOKIE", self.sso)):
+                    auth_cookies[cookie_name] = value
+                    auth_cookies[cookie_name]["domain"] = ".callofduty.com"
+                    auth_cookies[cookie_name]["path"] = "/"
+                session.cookie_jar.update_cookies(auth_cookies, response_url=URL(self.base_url))
+                self._save_cookies(cookie_jar)
+                logged_in = True
+            finally:
+                # a failed or cancelled login (e.g. end_wz stopping the tracker mid poll) doesn't leak the session
+                if not logged_in:
+                    await session.close()
+
+            self.session = session
+            return self.session
+
+    def _load_cookies(self, cookie_jar):
+        if self.cookie_path is None or not os.path.exists(self.cookie_path):
+            return
+
+        try:
+            cookie_jar.load(self.cookie_path)
+            with open(self.cookie_path + ".expires") as f:
+                self.xsrf_expires = json.load(f)["xsrf_expires"]
+        except Exception as e:
+            logger.error(f"Failed to load saved Warzone API cookies, logging in again: {e}")
+            cookie_jar.clear()
+            self.xsrf_expires = None
+
+    def _save_cookies(self, cookie_jar):
+        if self.cookie_path is None:
+            return
+
+        try:
+            cookie_jar.save(self.cookie_path)
+            with open(self.cookie_path + ".expires", "w") as f:
+                json.dump({"xsrf_expires": self.xsrf_expires}, f)
+        except Exception as e:
+            logger.error(f"Failed to save Warzone API cookies: {e}")
+
+    def _delete_cookies(self):
+        self.xsrf_expires = None
+        if self.cookie_path is None:
+            return
+        for path in (self.cookie_path, self.cookie_path + ".expires"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # returns the raw body of a successful API response. transient failures are retried with backoff
+    async def _wz_api_request(self, req_url):
+        # a half-open breaker lets exactly one request through, and that request keeps its retries
+        if not self.breaker.allow_request():
+            raise ApiUnavailableError(f"Warzone API paused after repeated failures ({self.breaker.last_error})",
+                                      self.breaker.get_retry_after())
+
+        try:
+            return await self._wz_api_retry_loop(req_url)
+        finally:
+            # only does anything if the request ended (budget, cancellation, ...) without recording an outcome
+            self.breaker.record_inconclusive()
+
+    async def _wz_api_retry_loop(self, req_url):
+        attempt = 0
+        while True:
+            try:
+                raw = await self._wz_api_attempt(req_url)
+            except ApiUnavailableError:
+                raise
+            except ApiError as e:
+                if e.retryable and attempt < self.max_retries:
+                    delay = get_retry_delay(attempt, retry_after=e.retry_after)
+                    if delay <= self.max_retry_wait:
+                        attempt += 1
+                        self.retries += 1
+                        API_RETRIES.inc(_get_endpoint(req_url))
+                        logger.warning(f"Warzone API request failed, retrying in {round(delay, 1)}s "
+                                       f"(attempt {attempt} of {self.max_retries}): {e}")
+                        await asyncio.sleep(delay)
+                        continue
+
+                # a request that is just bad (e.g. unknown match) still got an answer, so the API is up
+                if e.retryable or e.auth:
+                    self.breaker.record_failure(e)
+                else:
+                    self.breaker.record_success()
+                if e.auth:
+                    self.auth_expired = True
+                raise
+
+            self.breaker.record_success()
+            return raw
+
+    async def _wz_api_attempt(self, req_url):
+        if not self.budget.try_take():
+            raise ApiUnavailableError("Hourly Warzone API request budget is used up", self.budget.get_retry_after())
+
+        status = "error"
+        start = None
+        try:
+            session = await self._get_session()
+            async with self._semaphore:
+                start = time.perf_counter()  # not counting time spent waiting for a free slot
+                async with session.get(self.base_url + req_url) as resp:
+                    status = resp.status
+                    if resp.status != 200:
+                        text = await resp.text()
+                        raise ApiError(f"Unable to retrieve data from Warzone API. API responded with {resp.status}: {text[:500]}",
+                                       status=resp.status, retryable=resp.status == 429 or resp.status >= 500,
+                                       auth=resp.status in (401, 403),
+                                       retry_after=parse_retry_after(resp.headers.get("Retry-After")))
+
+                    raw = await resp.read()
+        except asyncio.TimeoutError as e:
+            status = "timeout"
+            raise ApiError(f"Warzone API request failed: {e!r}", retryable=True)
+        except aiohttp.ClientError as e:
+            raise ApiError(f"Warzone API request failed: {e!r}", retryable=True)
+        finally:
+            if start is not None:
+                API_LATENCY.observe(time.perf_counter() - start, _get_endpoint(req_url), status)
+
+        if not _has_success_status(raw):
+            # errors come back as 200s with a message, e.g. "Not permitted: not authenticated"
+            message = raw[:500].lower()
+            raise ApiError(f"API returned 200 status code but there was an unknown error. API responded with {raw[:500]}",
+                           status=resp.status, retryable=b"rate limit" in message,
+                           auth=b"not authenticated" in message)
+
+        return raw
+
+
+# the quick prefix check, falling back to decoding the body in case the status isn't its first key
+def _has_success_status(raw):
+    if SUCCESS_STATUS.match(raw[:64]):
+        return True
+    try:
+        data = loads(raw)
+    except ValueError:
+        return False
+    return isinstance(data, dict) and data.get("status") == "success"
 
-    def _wz_api_call(self, req_url):
-        resp = self.session.get(self.base_url + req_url, headers=self.user_agent_header)
-        if resp.status_code != 200:
-            raise Exception(f"Unable to retrieve data from Warzone API. API responded with {resp.status_code}: {resp.text}")
 
-        api_data = resp.json()
+# when a cookie set by a response expires, in epoch seconds
+def _get_cookie_expiry(morsel, now=None):
+    now = now if now is not None else time.time()
+    if morsel is not None:
+        try:
+            if morsel["max-age"]:
+                return now + int(morsel["max-age"])
+            if morsel["expires"]:
+                return parsedate_to_datetime(morsel["expires"]).timestamp()
+        except (TypeError, ValueError) as e:
+            logger.error(f"Couldn't read the expiry of cookie {morsel.key}: {e}")
+    return now + SESSION_COOKIE_LIFETIME
 
-        if api_data["status"] != "success":
-            raise Exception(f"API returned 200 status code but there was an unknown error. API responded with {api_data}")
 
-        return api_data
+# metric label for a request URL, so per-match/per-player URLs don't each get their own series
+def _get_endpoint(req_url):
+    return "matches" if "/matches/" in req_url else "match_details"
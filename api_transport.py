@@ -0,0 +1,116 @@
+import random
+import time
+from collections import deque
+
+
+# raised for any failed Warzone API request. retryable means trying again shortly has a chance of working
+# (timeouts, 5xx, rate limits). auth errors mean the cookies need replacing, so they are never retried
+class ApiError(Exception):
+    def __init__(self, message, status=None, retryable=False, auth=False, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.auth = auth
+        self.retry_after = retry_after  # seconds, from the Retry-After header if the API sent one
+
+
+# raised without making a request while the circuit breaker is open or the hourly budget is used up
+class ApiUnavailableError(ApiError):
+    def __init__(self, message, retry_after):
+        super().__init__(message, retry_after=retry_after)
+
+
+# retry delay for the given attempt (0 based): exponential backoff with full jitter, but never sooner than
+# the API asked for with Retry-After
+def get_retry_delay(attempt, base_delay=1.0, max_delay=30.0, retry_after=None):
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+# reads a Retry-After header given in seconds. the API doesn't send the HTTP date form
+def parse_retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+# stops all requests after failure_threshold requests in a row have failed (after their retries), so the bot
+# isn't hammering an API that is down or rejecting our cookies. after reset_timeout a single trial request is
+# let through: if it works the circuit closes again, otherwise it stays open for another reset_timeout. a trial
+# that ends without saying anything either way (budget used up, cancelled) reopens the circuit, and a trial
+# that somehow never reports back is replaced by a new one after another reset_timeout
+class CircuitBreaker():
+    def __init__(self, failure_threshold=5, reset_timeout=5 * 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+
+    def allow_request(self, now=None):
+        now = now if now is not None else time.time()
+        if self.state != "closed" and now - self.opened_at >= self.reset_timeout:
+            self.state = "half-open"
+            self.opened_at = now  # when the trial started
+            return True
+        return self.state == "closed"
+
+    def get_retry_after(self, now=None):
+        if self.state == "closed":
+            return 0
+        now = now if now is not None else time.time()
+        return max(0, self.opened_at + self.reset_timeout - now)
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.last_error = None
+
+    # the trial request ended without showing whether the API is back. wait out another reset_timeout
+    def record_inconclusive(self, now=None):
+        if self.state == "half-open":
+            self.state = "open"
+            self.opened_at = now if now is not None else time.time()
+
+    def record_failure(self, error, now=None):
+        self.failures += 1
+        self.last_error = str(error)
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = now if now is not None else time.time()
+
+
+# sliding window cap on the number of requests made in the last hour
+class RequestBudget():
+    def __init__(self, per_hour=600):
+        self.per_hour = per_hour
+        self.sent = deque()
+
+    def try_take(self, now=None):
+        now = now if now is not None else time.time()
+        self._expire(now)
+        if len(self.sent) >= self.per_hour:
+            return False
+
+        self.sent.append(now)
+        return True
+
+    def get_used(self, now=None):
+        self._expire(now if now is not None else time.time())
+        return len(self.sent)
+
+    def get_retry_after(self, now=None):
+        now = now if now is not None else time.time()
+        self._expire(now)
+        if len(self.sent) < self.per_hour:
+            return 0
+        return self.sent[0] + 60 * 60 - now
+
+    def _expire(self, now):
+        while self.sent and now - self.sent[0] >= 60 * 60:
+            self.sent.popleft()
@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import time
+
+from json_file import write_json_atomic
+from tracker_pipeline import TrackerPipeline
+
+logger = logging.getLogger(__name__)
+
+
+# walks back through an account's match history and records every match in the stats history, using the same
+# fetch/parse pipeline as the live tracker (minus notifications).
+# pages are requested by timestamp (get_matches' end parameter), and the checkpoint only moves past a page once
+# every match on it has been through the pipeline, so an interrupted run picks up exactly where it stopped.
+# matches whose details couldn't be fetched aren't recorded (the history ignores a match it already has, so an
+# empty row would never be filled in). they are kept in the checkpoint instead and retried at the start of the
+# next run.
+# max_requests caps the number of API requests per run - the run pauses (and can be resumed) once it's used up
+class Backfill():
+    def __init__(self, api, history, account, checkpoint_dir, max_requests=200, concurrency=4, stop_before=None):
+        self.api = api
+        self.history = history
+        self.account = account
+        self.checkpoint_path = os.path.join(checkpoint_dir, f"backfill_{account}.json")
+        self.max_requests = max_requests
+        self.concurrency = concurrency
+        self.stop_before = stop_before  # unix timestamp to stop at, None walks back as far as the API goes
+
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.requests = 0
+        self.checkpoint = self._load_checkpoint()
+
+    # returns "finished" once there is no more history, or "paused" if the request budget ran out first.
+    # running a finished backfill again starts a new pass from now down to where the last pass started, which
+    # picks up everything played in between
+    async def run(self):
+        if self.checkpoint["finished"] and not self.checkpoint["failed"]:
+            logging.info(f"Backfill for {self.account} already finished ({self.checkpoint['matches']} matches). "
+                         "Recording the matches played since it started.")
+            self.checkpoint.update({"floor": self.checkpoint["started"], "started": int(time.time()), "end": 0,
+                                    "finished": False})
+            self._save_checkpoint()
+
+        pipeline = TrackerPipeline(self.api, self._record_match, lambda notifications: None,
+                                   fetch_concurrency=self.concurrency)
+        pipeline.start()
+        try:
+            if self.checkpoint["failed"]:
+                retries = list(self.checkpoint["failed"].values())[:max(self.max_requests - self.requests, 0)]
+                logging.info(f"Backfill for {self.account}: retrying {len(retries)} matches that failed before.")
+                for match in retries:
+                    await pipeline.submit(self.account, match)
+                    self.requests += 1
+                await pipeline.join()
+
+            while True:
+                if self.checkpoint["finished"]:
+                    return "paused" if self.checkpoint["failed"] else "finished"
+                if self.requests >= self.max_requests:
+                    logging.info(f"Backfill for {self.account} used its request budget. Pausing.")
+                    return "paused"
+
+                end = self.checkpoint["end"]
+                matches = await self.api.get_matches(self.account, end=end) or []
+                self.requests += 1
+
+                # the page starts at or before a match we have already passed (or is empty) - we're done
+                matches = [match for match in matches if end == 0 or match["utcStartSeconds"] * 1000 < end]
+                # everything before the floor was recorded by an earlier pass
+                floor = max(self.checkpoint["floor"], self.stop_before or 0)
+                matches = [match for match in matches if match["utcStartSeconds"] >= floor]
+                if not matches:
+                    self.checkpoint["finished"] = True
+                    self._save_checkpoint()
+                    if self.checkpoint["failed"]:
+                        logging.info(f"Backfill for {self.account} reached the end of the history with "
+                                     f"{len(self.checkpoint['failed'])} matches still to retry.")
+                        return "paused"
+                    logging.info(f"Backfill for {self.account} finished ({self.checkpoint['matches']} matches).")
+                    return "finished"
+
+                # the budget is checked per page so pages are never half recorded
+                for match in reversed(matches):
+                    await pipeline.submit(self.account, match)
+                    self.requests += 1
+
+                oldest = min(match["utcStartSeconds"] for match in matches)
+                await pipeline.submit_cursor(self.account, oldest * 1000)
+                await pipeline.join()
+                logging.info(f"Backfill for {self.account}: {self.checkpoint['matches']} matches recorded, "
+                             f"{len(self.checkpoint['failed'])} to retry, {self.requests} requests used.")
+        finally:
+            pipeline.stop()
+
+    # whether the finished backfill recorded every match that started between start and end (unix timestamps).
+    # each pass walks back from when it was started, so anything played after that isn't covered until it's run again
+    def covers(self, start, end):
+        if not self.checkpoint["finished"] or self.checkpoint["failed"]:
+            return False
+        if self.stop_before is not None and start < self.stop_before:
+            return False
+        return end <= self.checkpoint["started"]
+
+    def get_status(self):
+        status = "finished" if self.checkpoint["finished"] and not self.checkpoint["failed"] else "in progress"
+        failed = f", {len(self.checkpoint['failed'])} to retry" if self.checkpoint["failed"] else ""
+        return f"{self.account}: {self.checkpoint['matches']} matches recorded{failed} ({status})"
+
+    # aggregate stage of the pipeline. cursor markers come through after every match on their page
+    def _record_match(self, job):
+        if job.match is None:
+            self.checkpoint["end"] = job.cursor
+            self._save_checkpoint()
+            return []
+
+        match = job.match
+        if job.team_stats is None:
+            # the details fetch failed. keep the match (its summary is all a retry needs) for the next run
+            self.checkpoint["failed"][match["matchID"]] = match
+            self._save_checkpoint()
+            return []
+
+        self.history.record_match(match["matchID"], None, match["utcStartSeconds"], match["utcEndSeconds"],
+                                  match["playerStats"]["teamPlacement"], job.team_stats)
+        self.checkpoint["matches"] += 1
+        if self.checkpoint["failed"].pop(match["matchID"], None) is not None:
+            self._save_checkpoint()
+        return []
+
+    def _load_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if checkpoint["account"] == self.account:
+                return checkpoint
+
+        # floor: start time the current pass stops at (where the previous one started)
+        return {"account": self.account, "started": int(time.time()), "floor": 0, "end": 0, "matches": 0,
+                "finished": False, "failed": {}}
+
+    def _save_checkpoint(self):
+        write_json_atomic(self.checkpoint_path, self.checkpoint)
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import tracemalloc
+
+from replay import FakeWarzoneServer, replay
+
+MAPS = ("mp_escape2", "mp_escape3", "mp_don4", "mp_wz_island")
+
+
+# builds a FakeWarzoneServer for a synthetic session: num_matches matches spread round robin across the tracked
+# accounts, with matches_per_poll new ones showing up for every poll. teams are drawn from a roster of
+# roster_size gamertags (the tracked accounts included), and every match has a full lobby of players
+def generate_session(num_matches, num_accounts, roster_size, matches_per_poll=2, lobby_size=150, team_size=4,
+                     seed=0):
+    rng = random.Random(seed)
+    accounts = [f"account{i}" for i in range(num_accounts)]
+    roster = accounts + [f"player{i}" for i in range(max(roster_size - num_accounts, team_size))]
+    start = int(time.time()) - num_matches * 25 * 60
+
+    matches = []
+    match_details = {}
+    for i in range(num_matches):
+        account = accounts[i % num_accounts]
+        match_id = str(1000000 + i)
+        match_start = start + i * 25 * 60
+        matches.append((account, {
+            "matchID": match_id,
+            "utcStartSeconds": match_start,
+            "utcEndSeconds": match_start + rng.randint(15, 25) * 60,
+            "map": rng.choice(MAPS),
+            "playerStats": {"teamPlacement": rng.randint(1, lobby_size // team_size)},
+            "player": {"team": "team0", "username": account}
+        }))
+
+        teammates = [account] + rng.sample([player for player in roster if player != account], team_size - 1)
+        players = []
+        for j in range(lobby_size):
+            team = j // team_size
+            username = teammates[j] if team == 0 else f"lobby{i}_{j}"
+            kills = float(rng.randint(0, 12))
+            players.append({
+                "player": {"team": f"team{team}", "username": username},
+                "playerStats": {"kills": kills, "deaths": float(rng.randint(0, 5)), "headshots": float(rng.randint(0, int(kills))),
+                                "assists": float(rng.randint(0, 6)), "damageDone": float(rng.randint(0, 4000)),
+                                "damageTaken": float(rng.randint(100, 3000))}
+            })
+        match_details[match_id] = json.dumps({"status": "success", "data": {"allPlayers": players}})
+
+    # one recent matches response per poll per account: the latest 20 matches that had been played by then
+    match_lists = {account: [] for account in accounts}
+    for poll in range(-(-num_matches // matches_per_poll)):
+        played = matches[:(poll + 1) * matches_per_poll]
+        for account in accounts:
+            recent = [match for match_account, match in reversed(played) if match_account == account][:20]
+            match_lists[account].append(json.dumps({"status": "success", "data": {"matches": recent}}))
+
+    return FakeWarzoneServer(match_lists, match_details)
+
+
+# best of repeat runs, in milliseconds. setup runs before each one, untimed
+def time_call(fn, repeat=5, setup=None):
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 3)
+
+
+async def run_scale(num_matches, num_accounts, roster_size):
+    result = await replay(generate_session(num_matches, num_accounts, roster_size))
+
+    # second pass just for memory, since tracing allocations slows everything else down
+    tracemalloc.start()
+    await replay(generate_session(num_matches, num_accounts, roster_size))
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    stat_tracker = result["stat_tracker"]
+    poll_times = sorted(result["poll_times"])
+    return {
+        "scale": f"{num_matches} matches, {num_accounts} accounts, {roster_size} players",
+        "polls": len(poll_times),
+        "matches": result["matches"],
+        "poll_p50_ms": round(poll_times[len(poll_times) // 2] * 1000, 2),
+        "poll_p95_ms": round(poll_times[int(len(poll_times) * 0.95)] * 1000, 2),
+        "matches_per_second": round(result["matches"] / result["elapsed"], 1),
+        "peak_memory_mb": round(peak_memory / 1024 / 1024, 2),
+        # rendering from scratch, with the render cache emptied before every call
+        "format_session_stats_ms": time_call(stat_tracker.format_session_stats, setup=stat_tracker.render_cache.clear),
+        "format_awards_ms": time_call(stat_tracker.format_awards, setup=stat_tracker.render_cache.clear),
+        "format_individual_stats_ms": time_call(lambda: [stat_tracker.format_individual_stats(username)
+                                                         for username in stat_tracker.get_usernames()],
+                                                setup=stat_tracker.render_cache.clear),
+        "cached_awards_ms": time_call(stat_tracker.format_awards)
+    }
+
+
+async def main(scales):
+    for scale in scales:
+        num_matches, num_accounts, roster_size = (int(value) for value in scale.split("x"))
+        results = await run_scale(num_matches, num_accounts, roster_size)
+        print(results.pop("scale"))
+        for name, value in results.items():
+            print(f"    {name}: {value}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Benchmark the tracker and StatTracker on synthetic sessions")
+    parser.add_argument("scales",
+                        nargs="*",
+                        default=["20x1x4", "100x2x16", "500x4x64"],
+                        help="MATCHESxACCOUNTSxPLAYERS, e.g. 100x2x16 (default: 20x1x4 100x2x16 500x4x64)")
+    args = parser.parse_args()
+    asyncio.run(main(args.scales))
@@ -0,0 +1,166 @@
+import asyncio
+import datetime
+import logging
+import re
+import time
+
+from discord import HTTPException, NotFound
+
+from message_dispatcher import RateLimiter
+from stats_history import parse_window
+
+logger = logging.getLogger(__name__)
+
+BULK_DELETE_MAX = 100  # most messages Discord deletes in one bulk delete
+# Discord only bulk deletes messages younger than 14 days. a minute of margin so a message doesn't age out
+# between being sorted and being deleted
+BULK_DELETE_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=1)
+
+
+# deletes the messages in a channel that match the filters. messages young enough to be bulk deleted go in
+# batches of 100 as history is scanned. older ones can only be deleted one at a time, so they are collected and
+# deleted afterwards, paced against the per-channel rate limit. run() is meant to be run as a task: cancelling
+# it stops the clear wherever it is
+class ChannelClear():
+    def __init__(self, channel, authors=None, bots_only=False, before=None, after=None, skip_ids=(),
+                 old_delete_rate=5, old_delete_per=5.0):
+        self.channel = channel
+        self.authors = set(authors) if authors else None  # author IDs to delete. None means everyone
+        self.bots_only = bots_only
+        self.before = before  # naive UTC datetimes, as discord.py expects
+        self.after = after
+        self.skip_ids = set(skip_ids)  # e.g. the progress message
+        self.old_limiter = RateLimiter(old_delete_rate, old_delete_per)
+
+        self.state = "scanning"
+        self.scanned = 0
+        self.matched = 0
+        self.deleted = 0
+        self.old_total = 0
+        self.failed = 0
+        self.started_at = time.time()
+
+    def matches(self, message):
+        if message.id in self.skip_ids:
+            return False
+        if self.bots_only and not message.author.bot:
+            return False
+        return self.authors is None or message.author.id in self.authors
+
+    async def run(self):
+        cutoff = datetime.datetime.utcnow() - BULK_DELETE_AGE
+        batch = []
+        old_messages = []
+        async for message in self.channel.history(limit=None, before=self.before, after=self.after):
+            self.scanned += 1
+            if not self.matches(message):
+                continue
+
+            self.matched += 1
+            if message.created_at > cutoff:
+                batch.append(message)
+                if len(batch) == BULK_DELETE_MAX:
+                    await self._delete_batch(batch)
+                    batch = []
+            else:
+                old_messages.append(message)
+
+        if batch:
+            await self._delete_batch(batch)
+
+        self.state = "deleting old messages"
+        self.old_total = len(old_messages)
+        for message in old_messages:
+            await self.old_limiter.wait()
+            await self._delete_one(message)
+
+        self.state = "finished"
+
+    def get_progress(self):
+        progress = f"{self.deleted}/{self.matched} messages deleted ({self.scanned} scanned"
+        if self.old_total:
+            progress += f", {self.old_total} older than 14 days, deleted one at a time"
+        if self.failed:
+            progress += f", {self.failed} failed"
+        return progress + f") in {round(time.time() - self.started_at)} seconds"
+
+    async def _delete_batch(self, batch):
+        if len(batch) == 1:
+            await self._delete_one(batch[0])
+            return
+
+        try:
+            await self.channel.delete_messages(batch)
+            self.deleted += len(batch)
+        except HTTPException as e:
+            # e.g. one of the messages aged out after all. fall back to deleting them one by one
+            logger.error(f"Bulk delete of {len(batch)} messages in #{self.channel} failed: {e}")
+            for message in batch:
+                await self.old_limiter.wait()
+                await self._delete_one(message)
+
+    async def _delete_one(self, message):
+        try:
+            await message.delete()
+            self.deleted += 1
+        except NotFound:
+            self.deleted += 1  # someone else got to it first
+        except HTTPException as e:
+            logger.error(f"Failed to delete message {message.id} in #{self.channel}: {e}")
+            self.failed += 1
+
+
+# turns clear_channel's arguments into ChannelClear filters:
+#   bots: only messages from bots
+#   @user (or a user ID): only that user's messages (can be repeated)
+#   before:X / after:X: X is a date (YYYY-MM-DD) or a window ago (7d, 2w)
+# returns the filters as keyword arguments, or an error message
+def parse_clear_args(args, mention_ids):
+    filters = {"authors": set(mention_ids), "bots_only": False, "before": None, "after": None}
+    for arg in args:
+        arg = arg.strip()
+        if arg.lower() in ("bots", "bot"):
+            filters["bots_only"] = True
+        elif re.fullmatch(r"<@!?\d+>", arg):
+            continue  # already in mention_ids
+        elif arg.isdigit():
+            filters["authors"].add(int(arg))
+        elif ":" in arg and arg.split(":", 1)[0].lower() in ("before", "after"):
+            key, value = arg.split(":", 1)
+            when = _parse_time(value)
+            if when is None:
+                return None, f"Couldn't read \"{value}\". Use a date like 2021-11-03 or a window like 7d or 2w."
+            filters[key.lower()] = when
+        else:
+            return None, f"Unknown filter \"{arg}\"."
+
+    if filters["before"] is not None and filters["after"] is not None and filters["after"] >= filters["before"]:
+        return None, "after has to be earlier than before."
+    return filters, None
+
+
+def _parse_time(value):
+    days = parse_window(value)
+    if days is not None:
+        return datetime.datetime.utcnow() - datetime.timedelta(days=days)
+
+    try:
+        # dates are taken as local midnight, the same as the times the bot prints
+        local = datetime.datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return None
+    return datetime.datetime.utcfromtimestamp(time.mktime(local.timetuple()))
+
+
+# updates a status message with the clear's progress every interval seconds until it's done (or cancelled)
+async def report_progress(clear, status_message, interval=5.0):
+    last = None
+    while clear.state != "finished":
+        await asyncio.sleep(interval)
+        progress = f"Clearing #{clear.channel}: {clear.state}. {clear.get_progress()}"
+        if progress != last:
+            try:
+                await status_message.edit(content=progress)
+            except HTTPException as e:
+                logger.error(f"Failed to update clear_channel progress: {e}")
+            last = progress
@@ -0,0 +1,79 @@
+import logging
+
+from discord import TextChannel
+
+logger = logging.getLogger(__name__)
+
+
+# every guild the bot is in, indexed by ID (and name, since the legacy config refers to guilds by name), and
+# each guild's tracker notification channel. filled in once when the bot connects, then kept up to date from
+# guild and channel events instead of scanning every channel of every guild again
+class ChannelRegistry():
+    def __init__(self, config):
+        self.config = config
+        self.guilds = {}  # guild ID -> guild
+        self.guild_ids_by_name = {}
+        self.channels = {}  # guild ID -> notification channel
+
+    def add_guild(self, guild):
+        self.guilds[guild.id] = guild
+        self.guild_ids_by_name[guild.name] = guild.id
+        self.channels.pop(guild.id, None)
+
+        wanted = self._get_wanted_channel(guild)
+        channel = guild.get_channel(int(wanted)) if str(wanted).isdigit() else None
+        if channel is None:
+            channel = next((channel for channel in guild.text_channels if channel.name == wanted), None)
+        if channel is not None:
+            self.channels[guild.id] = channel
+
+    def remove_guild(self, guild):
+        self.guilds.pop(guild.id, None)
+        self.channels.pop(guild.id, None)
+        if self.guild_ids_by_name.get(guild.name) == guild.id:
+            del self.guild_ids_by_name[guild.name]
+
+    def update_guild(self, before, after):
+        if before.name != after.name:
+            self.remove_guild(before)
+            self.add_guild(after)
+        else:
+            self.guilds[after.id] = after
+
+    def add_channel(self, channel):
+        if self._is_notification_channel(channel) and channel.guild.id not in self.channels:
+            self.channels[channel.guild.id] = channel
+
+    def remove_channel(self, channel):
+        current = self.channels.get(channel.guild.id)
+        if current is not None and current.id == channel.id:
+            del self.channels[channel.guild.id]
+
+    def update_channel(self, before, after):
+        current = self.channels.get(after.guild.id)
+        if self._is_notification_channel(after):
+            if current is None or current.id == after.id:
+                self.channels[after.guild.id] = after
+        elif current is not None and current.id == after.id:
+            del self.channels[after.guild.id]
+
+    def get_channel(self, guild_id):
+        return self.channels.get(guild_id)
+
+    # guild ID from a config key, which can be either an ID or a name
+    def find_guild_id(self, key):
+        if str(key).isdigit() and int(key) in self.guilds:
+            return int(key)
+        return self.guild_ids_by_name.get(key)
+
+    def get_num_guilds(self):
+        return len(self.guilds)
+
+    def _get_wanted_channel(self, guild):
+        return self.config.get(guild.id, guild.name)["channel"]
+
+    def _is_notification_channel(self, channel):
+        if not isinstance(channel, TextChannel):
+            return False
+        wanted = self._get_wanted_channel(channel.guild)
+        return str(channel.id) == str(wanted) or channel.name == wanted
@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+import time
+
+from json_file import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# used until there is a registry file. new players are added with !link instead of here
+DEFAULT_PLAYERS = {
+    "bglowniak": 250017966928691211,
+    "triplexlink": 273518554517602305,
+    "funny_monkey998": 479298269110075433,
+    "MisterDuV": 425035767350296578,
+    "Sharkyplace": 545430460860334082,
+    "TetoTeto": 483853566281383946,
+    "cooliodude13": 137213864872902656
+}
+
+# map IDs start with one of these codes (e.g. mp_wz_island_night)
+DEFAULT_MAPS = {
+    "mp_don": "Verdansk",
+    "mp_escape": "Rebirth",
+    "mp_wz_island": "Caldera",
+    "mp_sm_island": "Fortune's Keep"
+}
+
+
+# gamertag <-> Discord ID links and map code prefixes -> map names, persisted to a JSON file
+# ({"players": {gamertag: discord ID}, "maps": {prefix: name}}). gamertags are looked up in a dict (case
+# insensitive), and map codes by trying each distinct prefix length once, longest first, with every answer
+# memoized. the file is re-read when it changes on disk (checked at most once every reload_interval seconds),
+# so links and map names can be edited without a restart
+class GamertagRegistry():
+    def __init__(self, path=None, reload_interval=60):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.file_mtime = None
+        self.last_checked = 0
+        self.version = 0  # bumped on every change, so anything rendered with the old names can be redone
+        self._set(DEFAULT_PLAYERS, DEFAULT_MAPS)
+        self._reload_if_changed()
+
+    # Discord mention for a gamertag, or the gamertag itself if nobody has linked it
+    def get_mention(self, gamertag):
+        self._reload_if_changed()
+        discord_id = self.players.get(gamertag.lower())
+        return f"<@{discord_id}>" if discord_id is not None else gamertag
+
+    def get_discord_id(self, gamertag):
+        self._reload_if_changed()
+        return self.players.get(gamertag.lower())
+
+    def get_gamertags(self, discord_id):
+        self._reload_if_changed()
+        return sorted(self.gamertags.get(discord_id, ()), key=str.lower)
+
+    def get_map_name(self, map_code):
+        self._reload_if_changed()
+        name = self.map_lookups.get(map_code)
+        if name is None:
+            name = map_code
+            for length in self.prefix_lengths:
+                prefix_name = self.maps.get(map_code[:length])
+                if prefix_name is not None:
+                    name = prefix_name
+                    break
+            self.map_lookups[map_code] = name
+        return name
+
+    # links a gamertag to a Discord user, replacing any previous link. returns the Discord ID it was linked to
+    def link(self, gamertag, discord_id):
+        self._reload_if_changed()
+        previous = self.players.get(gamertag.lower())
+        self._remove(gamertag)
+        self.display_names[gamertag.lower()] = gamertag
+        self.players[gamertag.lower()] = discord_id
+        self.gamertags.setdefault(discord_id, set()).add(gamertag)
+        self._save()
+        return previous
+
+    # returns the Discord ID the gamertag was linked to, or None if it wasn't linked
+    def unlink(self, gamertag):
+        self._reload_if_changed()
+        discord_id = self._remove(gamertag)
+        if discord_id is not None:
+            self._save()
+        return discord_id
+
+    def get_version(self):
+        self._reload_if_changed()
+        return self.version
+
+    def _remove(self, gamertag):
+        self.version += 1
+        key = gamertag.lower()
+        discord_id = self.players.pop(key, None)
+        if discord_id is not None:
+            self.gamertags[discord_id].discard(self.display_names.pop(key))
+            if not self.gamertags[discord_id]:
+                del self.gamertags[discord_id]
+        return discord_id
+
+    def _set(self, players, maps):
+        self.version += 1
+        self.display_names = {gamertag.lower(): gamertag for gamertag in players}
+        self.players = {gamertag.lower(): int(discord_id) for gamertag, discord_id in players.items()}
+        self.gamertags = {}  # Discord ID -> its gamertags
+        for gamertag, discord_id in players.items():
+            self.gamertags.setdefault(int(discord_id), set()).add(gamertag)
+
+        self.maps = dict(maps)
+        self.prefix_lengths = sorted({len(prefix) for prefix in self.maps}, reverse=True)
+        self.map_lookups = {}  # map code -> name, filled in as codes are looked up
+
+    # re-reads the file if its modification time changed since it was loaded
+    def _reload_if_changed(self):
+        now = time.time()
+        if self.path is None or now - self.last_checked < self.reload_interval:
+            return
+
+        self.last_checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self.file_mtime:
+            return
+
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except ValueError as e:
+            logger.error(f"Gamertag registry at {self.path} is unreadable, keeping the current one: {e}")
+            return
+
+        self.file_mtime = mtime
+        self._set(data.get("players", {}), data.get("maps", {}))
+        logging.info(f"Loaded {len(self.players)} gamertags and {len(self.maps)} maps from {self.path}.")
+
+    def _save(self):
+        if self.path is None:
+            return
+
+        players = {self.display_names[key]: discord_id for key, discord_id in self.players.items()}
+        write_json_atomic(self.path, {"players": players, "maps": self.maps}, indent=4)
+        self.file_mtime = os.stat(self.path).st_mtime
+
+
+# used by stat trackers that aren't given the bot's registry
+default_registry = GamertagRegistry()
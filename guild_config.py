@@ -0,0 +1,40 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# settings used for anything a guild's entry doesn't set
+DEFAULT_SETTINGS = {
+    "channel": "wz_bot",  # tracker notification channel, by name or ID
+    "accounts": None,  # gamertags this guild's sessions track. None means COD_USERNAMES
+    "manage_sessions": False,  # whether start_wz, end_wz and backfill can be used here
+    "session_guild": None  # guild (name or ID) whose session this guild's commands act on. None means itself
+}
+
+
+# the original single server setup: sessions are run from the test server and announced in lumber gang
+# (or in the test server itself in debug mode)
+def get_legacy_config(debug):
+    return {
+        "lumber gang": {"channel": "wz_bot"},
+        "Bot Test Server": {"channel": "general", "manage_sessions": True,
+                            "session_guild": None if debug else "lumber gang"}
+    }
+
+
+# per-guild settings, from a JSON file mapping guild IDs (or names) to settings, e.g.
+# {"123456789": {"channel": "wz_bot", "accounts": ["bglowniak"], "manage_sessions": true}}
+# without a file, the legacy two server setup is used
+class GuildConfig():
+    def __init__(self, path=None, debug=True):
+        self.guilds = get_legacy_config(debug)
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.guilds = json.load(f)
+            logging.info(f"Loaded settings for {len(self.guilds)} guilds from {path}.")
+
+    def get(self, guild_id, guild_name=None):
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(self.guilds.get(str(guild_id)) or self.guilds.get(guild_name) or {})
+        return settings
@@ -0,0 +1,87 @@
+import logging
+import time
+
+from session_store import SessionStore
+from stat_tracker import StatTracker
+
+logger = logging.getLogger(__name__)
+
+
+# one guild's Warzone session: its stats, which accounts it follows and which matches it has counted.
+# every change is logged as an event before anything is announced, so a restart can replay it. the full state is
+# snapshotted periodically to keep the replay short
+class GuildSession():
+    def __init__(self, guild_id, directory, accounts, names=None):
+        self.guild_id = guild_id
+        self.accounts = accounts
+        self.names = names  # gamertag registry used by the stat tracker's messages
+        self.stat_tracker = StatTracker(names)
+        # every match ID counted this session, so a match that shows up for multiple tracked accounts is only
+        # counted once
+        self.processed_match_ids = set()
+        self.session_active = False
+        self.session_start_time = None
+        self.history_session_id = None
+        self.store = SessionStore(directory)
+
+    def record_event(self, event):
+        self.store.append(event)
+        if self.store.should_snapshot():
+            self.store.write_snapshot(self.get_state())
+
+    # for events (start/end) that should be covered by a snapshot straight away
+    def record_event_and_snapshot(self, event):
+        self.store.append(event)
+        self.store.write_snapshot(self.get_state())
+
+    def get_state(self):
+        return {
+            "session_active": self.session_active,
+            "accounts": self.accounts,
+            "stat_tracker": self.stat_tracker.to_snapshot(),
+            "session_start_time": self.session_start_time,
+            "processed_match_ids": list(self.processed_match_ids),
+            "history_session_id": self.history_session_id
+        }
+
+    def restore(self):
+        state, events = self.store.restore()
+        if state is not None:
+            self.session_active = state["session_active"]
+            self.accounts = state["accounts"]
+            self.stat_tracker = StatTracker.from_snapshot(state["stat_tracker"], self.names)
+            self.session_start_time = state["session_start_time"]
+            self.processed_match_ids = set(state["processed_match_ids"])
+            self.history_session_id = state["history_session_id"]
+
+        for event in events:
+            self.apply_event(event)
+
+        if self.session_active:
+            logging.info(f"Restored active Warzone session for guild {self.guild_id} "
+                         f"({self.stat_tracker.get_num_matches()} matches, {len(events)} events replayed).")
+
+    # replays a logged event the same way the tracker and commands applied it originally
+    def apply_event(self, event):
+        event_type = event["type"]
+        if event_type == "start":
+            if not event["continue"]:
+                self.stat_tracker = StatTracker(self.names)
+                self.processed_match_ids = set()
+                self.session_start_time = event["time"]
+            elif self.session_start_time is None:
+                self.session_start_time = event["time"]
+            self.stat_tracker.set_start_time(time.localtime(event["time"]))
+            self.history_session_id = event["history_session_id"]
+            self.accounts = event["accounts"]
+            self.session_active = True
+        elif event_type == "end":
+            self.session_active = False
+        elif event_type == "match":
+            self.processed_match_ids.add(event["match_id"])
+            self.stat_tracker.update_cumulative_match_stats(event["placement"])
+            for username, player_stats in event["players"].items():
+                self.stat_tracker.update_cumulative_player_stats(username, player_stats)
+
+    def close(self):
+        self.store.close()
@@ -0,0 +1,15 @@
+import json
+import os
+
+
+# writes data as JSON to a temporary file next to path, then moves it into place. the move is atomic on POSIX
+# and Windows, so a crash mid-write leaves the previous file intact. with fsync the new file is flushed to disk
+# before it replaces the old one
+def write_json_atomic(path, data, fsync=False, **dump_args):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, **dump_args)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -1,7 +1,12 @@
 import os
 import argparse
+import asyncio
 import logging
+from api_session import WarzoneApi
+from backfill import Backfill
 from lumber_bot import LumberBot
+from match_cache import MatchCache
+from stats_history import StatsHistory
 from dotenv import load_dotenv
 from discord.ext import commands
 
@@ -12,6 +17,21 @@ logging.basicConfig(
     datefmt='%H:%M:%S'
 )
 
+
+async def run_backfill(account, max_requests):
+    cache = MatchCache(os.getenv("MATCH_CACHE_PATH", "match_cache.db"))
+    history = StatsHistory(os.getenv("HISTORY_DB_PATH", "history.db"))
+    api = WarzoneApi(cache=cache, cookie_path=os.getenv("WZ_COOKIE_PATH", "wz_cookies.pickle"))
+    backfill = Backfill(api, history, account, os.getenv("BACKFILL_DIR", "backfill"), max_requests=max_requests)
+    try:
+        result = await backfill.run()
+        logger.info(f"Backfill {result}. {backfill.get_status()}")
+    finally:
+        await api.close()
+        history.close()
+        cache.close()
+
+
 if __name__ == "__main__":
     load_dotenv()
     TOKEN = os.getenv("DISCORD_TOKEN")
@@ -20,9 +40,24 @@ if __name__ == "__main__":
     parser.add_argument('-a', '--active',
                         action='store_true',
                         help="Marks this as an active session (will send messages to public discord)")
+    parser.add_argument('-b', '--backfill',
+                        metavar="GAMERTAG",
+                        help="Backfill the stats history with GAMERTAG's past matches instead of running the bot")
+    parser.add_argument('-w', '--worker',
+                        action='store_true',
+                        help="Run Warzone polling, parsing and session stats in a separate worker process")
+    parser.add_argument('--budget',
+                        type=int,
+                        default=200,
+                        help="Max API requests for this backfill run (default 200)")
     args = parser.parse_args()
 
+    if args.backfill:
+        asyncio.run(run_backfill(args.backfill, args.budget))
+        raise SystemExit
+
     debug = not args.active
 
-    bot = LumberBot(command_prefix=commands.when_mentioned_or("!"), debug=debug)
+    bot = LumberBot(command_prefix=commands.when_mentioned_or("!"), debug=debug,
+                    tracker_mode="gateway" if args.worker else "local")
     bot.run(TOKEN)
@@ -1,36 +1,115 @@
 import os
-import random
-import re
+import asyncio
 import logging
+import io
 import time
-from discord import File
-from discord.ext import tasks
-from discord.ext.commands import Bot, command, CommandNotFound
+from discord import Embed, File
+from discord.ext.commands import Bot, command, is_owner, has_permissions, CheckFailure, CommandNotFound
 
 from api_session import WarzoneApi
+from backfill import Backfill
+from channel_cleaner import ChannelClear, parse_clear_args, report_progress
+from channel_registry import ChannelRegistry
+from gamertag_registry import GamertagRegistry
+from guild_config import GuildConfig
+from guild_session import GuildSession
+from match_cache import MatchCache
+from message_dispatcher import MessageDispatcher, send_paged
+from metrics import registry, monitor_loop_lag, start_metrics_server
+from poll_scheduler import PollScheduler
+from profiling import LoopWatchdog, SamplingProfiler
+from replay import ApiRecorder
+from salute_media import SaluteMedia
+from seen_matches import SeenMatches
 from stat_tracker import StatTracker
+from stats_history import StatsHistory, parse_window
+from tracker_pipeline import TrackerPipeline
+from tracker_worker import WORKER_COMMANDS, WorkerProcess
+from triggers import TriggerEngine, load_triggers
 
 logger = logging.getLogger(__name__)
 
+POLL_SECONDS = registry.histogram("tracker_poll_seconds", "Time to poll one account and queue its new matches",
+                                  ("account",))
+POLL_MATCHES = registry.histogram("tracker_poll_matches", "New matches queued per poll", ("account",),
+                                  buckets=(0, 1, 2, 3, 5, 10, 20, 50))
+MATCHES_PROCESSED = registry.counter("tracker_matches_processed_total", "Matches added to the session stats")
+MATCH_CACHE_STATS = registry.gauge("match_cache", "Match cache hits and misses since startup, and its size",
+                                   ("stat",))
+SEND_SECONDS = registry.histogram("discord_send_seconds", "Time to send a tracker notification to Discord",
+                                  ("kind",))
+ON_MESSAGE_SECONDS = registry.histogram("on_message_seconds", "Time to handle one Discord message")
+
 
 class LumberBot(Bot):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.greetings = ["hello", "hi", "hiya", "hey", "howdy",
-                          "sup", "hola", "privet", "salve", "ciao",
-                          "konnichiwa", "shalom"]
-
         self.mention_id = os.getenv("BOT_MENTION_ID")
+        # message triggers (greetings, "trip", ...) compiled once into a single matcher
+        self.triggers = TriggerEngine(load_triggers(os.getenv("TRIGGER_CONFIG")), self.mention_id)
         self.salute_directory = os.getenv("SALUTE_DIRECTORY")
-        self.cod_username = os.getenv("COD_USERNAME")
+        self.salutes = SaluteMedia(self.salute_directory, os.getenv("SALUTE_URL_CACHE", "salute_urls.json"))
+        self.dispatcher = MessageDispatcher(self.send_notification)
+        # comma-separated list of gamertags to track. falls back to just my account. guilds can track their own
+        # accounts in the guild config
+        cod_usernames = os.getenv("COD_USERNAMES") or os.getenv("COD_USERNAME")
+        self.cod_usernames = [username.strip() for username in cod_usernames.split(",") if username.strip()]
 
         self.debug = kwargs["debug"]
-
-        self.most_recent_match_id = None  # used for warzone win tracking
-        self.session_active = False
-
-        self.api = WarzoneApi()
-        self.stat_tracker = StatTracker()
+        # "local" runs everything in this process. "gateway" hands the Warzone tracker and session commands to a
+        # worker process (see tracker_worker.py), and "worker" is the bot running inside that process
+        self.tracker_mode = kwargs.get("tracker_mode", "local")
+        self.worker = None  # gateway mode: the worker process
+        self.worker_task = None
+        self.gateway = None  # worker mode: the queues back to the gateway
+
+        # gamertag -> Discord user links (edited with !link/!unlink) and map names, reloaded when the file changes
+        self.gamertags = GamertagRegistry(os.getenv("GAMERTAG_REGISTRY_PATH", "gamertags.json"))
+
+        # per-guild settings, and each guild's notification channel (kept up to date from guild/channel events)
+        self.guild_config = GuildConfig(os.getenv("GUILD_CONFIG"), self.debug)
+        self.channel_registry = ChannelRegistry(self.guild_config)
+
+        # used for warzone win tracking. one poller and pipeline serve every guild's session
+        self.match_gaps = {}  # account -> (from, to) start times where matches may have been missed
+        self.max_gap_pages = 3  # extra pages of history fetched to close a gap before reporting it
+        self.poll_schedulers = {}  # account -> PollScheduler, for every account polled so far
+        self.pending_match_ids = set()  # (account, match ID) submitted to the tracker pipeline but not aggregated yet
+        self.match_retries = {}  # (account, match ID) -> (match, attempts) for matches whose details couldn't be fetched
+        self.max_match_attempts = 5
+        self.pipeline = None
+        self.tracker_task = None
+        self.tracker_wakeup = None  # set when the accounts to poll change
+
+        # the tracker's state and the files behind it. in gateway mode the worker owns all of it, so the gateway
+        # leaves these as None instead of opening the same files (and saving over the worker's on close)
+        self.seen_matches = None
+        self.match_cache = None
+        self.api = None
+        self.history = None
+        if self.tracker_mode != "gateway":
+            # every match the tracker has handled for each account (kept across sessions and restarts)
+            self.seen_matches = SeenMatches(os.getenv("SEEN_MATCHES_PATH", "seen_matches.json"))
+            self.match_cache = MatchCache(os.getenv("MATCH_CACHE_PATH", "match_cache.db"))
+            self.api = WarzoneApi(cache=self.match_cache, hourly_budget=int(os.getenv("WZ_API_HOURLY_BUDGET", 600)),
+                                  cookie_path=os.getenv("WZ_COOKIE_PATH", "wz_cookies.pickle"))
+            # record every API response so the session can be replayed offline (see replay.py)
+            if os.getenv("RECORD_API_DIR"):
+                self.api.recorder = ApiRecorder(os.getenv("RECORD_API_DIR"))
+
+            # permanent record of every processed match, used for stats beyond the current session
+            self.history = StatsHistory(os.getenv("HISTORY_DB_PATH", "history.db"))
+
+        self.backfill_dir = os.getenv("BACKFILL_DIR", "backfill")
+        self.backfill_tasks = {}  # gamertag -> running backfill task
+        self.clear_tasks = {}  # channel ID -> running clear_channel task
+
+        # one session per guild, each persisted in its own directory (named by guild ID) under SESSION_STORE_DIR.
+        # restore whatever was there when the bot last stopped (or crashed)
+        self.session_store_dir = os.getenv("SESSION_STORE_DIR", "session_data")
+        self.sessions = {}  # guild ID -> GuildSession
+        if self.tracker_mode != "gateway":
+            self.restore_sessions()
 
         # eventually add loop in init to add all commands regardless of number (to avoid having to hardcode)
         self.add_command(self.session_stats)
@@ -39,238 +118,864 @@ class LumberBot(Bot):
         self.add_command(self.start_wz)
         self.add_command(self.end_wz)
         self.add_command(self.clear_channel)
-
-    def collect_default_channels(self):
-        channels = {}
-        for guild in self.guilds:
-            for channel in guild.text_channels:
-                if (guild.name == "lumber gang" and channel.name == "wz_bot") or (guild.name == "Bot Test Server" and channel.name == "general"):
-                    channels[guild.name] = channel
-
-        return channels
+        self.add_command(self.tracker_status)
+        self.add_command(self.backfill)
+        self.add_command(self.metrics)
+        self.add_command(self.profile)
+        self.add_command(self.link)
+        self.add_command(self.unlink)
+
+        # Prometheus endpoint, only served if METRICS_PORT is set. localhost only unless METRICS_HOST says otherwise
+        self.metrics_port = os.getenv("METRICS_PORT")
+        self.metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+        self.metrics_runner = None
+        self.lag_monitor_task = None
+
+        # logs the stack whenever the event loop is blocked for longer than SLOW_CALLBACK_THRESHOLD seconds
+        self.watchdog = LoopWatchdog(float(os.getenv("SLOW_CALLBACK_THRESHOLD", 0.5)))
+        self.watchdog_started = False
+        self.profiler = SamplingProfiler()
+
+    # used by the dispatcher to deliver queued tracker notifications
+    async def send_notification(self, channel, content, salute):
+        with SEND_SECONDS.time("salute" if salute else "text"):
+            if salute:
+                return await self.salutes.send(channel, content)
+            return await channel.send(content)
+
+    async def close(self):
+        if self.worker_task is not None:
+            self.worker_task.cancel()
+        if self.worker is not None:
+            self.worker.stop()
+        self.stop_tracker()
+        for task in list(self.clear_tasks.values()):
+            task.cancel()
+        self.dispatcher.close()
+        if self.lag_monitor_task is not None:
+            self.lag_monitor_task.cancel()
+        self.watchdog.stop()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        if self.tracker_mode != "gateway":
+            self.seen_matches.save()
+            await self.api.close()
+            self.match_cache.close()
+            for session in self.sessions.values():
+                session.close()
+            self.history.close()
+        await super().close()
+
+    #################################    SESSION PERSISTENCE    #################################
+
+    def restore_sessions(self):
+        os.makedirs(self.session_store_dir, exist_ok=True)
+        for name in os.listdir(self.session_store_dir):
+            if name.isdigit() and os.path.isdir(os.path.join(self.session_store_dir, name)):
+                session = self.create_session(int(name))
+                session.restore()
+
+    def create_session(self, guild_id):
+        guild = self.channel_registry.guilds.get(guild_id)
+        accounts = self.guild_config.get(guild_id, guild.name if guild is not None else None)["accounts"]
+        session = GuildSession(guild_id, os.path.join(self.session_store_dir, str(guild_id)),
+                               accounts or self.cod_usernames, self.gamertags)
+        self.sessions[guild_id] = session
+        return session
+
+    # pick restored sessions back up. only done once the guilds are known, so their notifications have a channel
+    def resume_sessions(self):
+        # on_ready also fires on reconnects, so only start the tracker once
+        if self.get_active_sessions() and self.tracker_task is None:
+            logging.info(f"Resuming Warzone tracker for {len(self.get_active_sessions())} restored sessions.")
+            self.start_tracker()
+
+    # worker mode: the worker has no Discord connection, so the gateway sends it the guild IDs and names
+    def set_remote_guilds(self, guilds):
+        self.channel_registry = ChannelRegistry(self.guild_config)
+        for guild in guilds:
+            self.channel_registry.add_guild(guild)
+
+    def get_guild_settings(self, guild):
+        return self.guild_config.get(guild.id, guild.name)
+
+    # the session a guild's commands act on. that's the guild's own session unless its config points elsewhere
+    # (e.g. the test server running the main server's session). returns None if there isn't one yet
+    def get_session(self, guild, create=False):
+        if guild is None:
+            return None
+
+        session_guild = self.get_guild_settings(guild)["session_guild"]
+        guild_id = self.channel_registry.find_guild_id(session_guild) if session_guild else guild.id
+        if guild_id is None:
+            return None
+        if guild_id not in self.sessions and create:
+            return self.create_session(guild_id)
+        return self.sessions.get(guild_id)
+
+    def get_active_sessions(self):
+        return [session for session in self.sessions.values() if session.session_active]
+
+    # every account followed by an active session, in a stable order
+    def get_tracked_accounts(self):
+        accounts = []
+        for session in self.get_active_sessions():
+            accounts.extend(account for account in session.accounts if account not in accounts)
+        return accounts
 
     #################################    EVENTS    #################################
 
     async def on_ready(self):
         logging.info(f'{self.user} has connected to Discord')
-        self.default_channels = self.collect_default_channels()
-        if self.debug:
-            self.server = "Bot Test Server"
+        # the one full pass over guilds - after this the registry is kept up to date by the events below
+        for guild in self.guilds:
+            self.channel_registry.add_guild(guild)
+        logging.info(f"Debug mode: {self.debug}. In {self.channel_registry.get_num_guilds()} guilds, "
+                     f"{len(self.channel_registry.channels)} with a tracker channel.")
+
+        if self.lag_monitor_task is None:
+            self.lag_monitor_task = self.loop.create_task(monitor_loop_lag())
+        if not self.watchdog_started:
+            self.watchdog.start(self.loop)
+            self.watchdog_started = True
+        if self.metrics_port and self.metrics_runner is None:
+            try:
+                self.metrics_runner = await start_metrics_server(self.metrics_host, int(self.metrics_port))
+            except Exception as e:
+                logger.error(f"Failed to start metrics server on port {self.metrics_port}: {e}")
+
+        if self.tracker_mode == "gateway":
+            if self.worker_task is None:
+                self.worker_task = self.loop.create_task(self.run_worker())
+            elif self.worker.is_alive():
+                self.worker.send_guilds(self.guilds)
         else:
-            self.server = "lumber gang"
-        logging.info(f"Debug mode: {self.debug}. Win messages will default to {self.server}")
+            self.resume_sessions()
+
+    async def on_guild_join(self, guild):
+        logging.info(f"Joined guild {guild.name} ({guild.id}).")
+        self.channel_registry.add_guild(guild)
+        self.send_guilds_to_worker()
+
+    async def on_guild_remove(self, guild):
+        logging.info(f"Removed from guild {guild.name} ({guild.id}).")
+        self.channel_registry.remove_guild(guild)
+        self.send_guilds_to_worker()
+
+    async def on_guild_update(self, before, after):
+        self.channel_registry.update_guild(before, after)
+        if before.name != after.name:
+            self.send_guilds_to_worker()
+
+    async def on_guild_channel_create(self, channel):
+        self.channel_registry.add_channel(channel)
+
+    async def on_guild_channel_delete(self, channel):
+        self.channel_registry.remove_channel(channel)
+
+    async def on_guild_channel_update(self, before, after):
+        self.channel_registry.update_channel(before, after)
 
     # override on_message to implement some functionality outside of normal commands
     async def on_message(self, message):
         if message.author == self.user or message.author.bot:
             return
 
+        with ON_MESSAGE_SECONDS.time():
+            await self.handle_message(message)
+
+    async def handle_message(self, message):
         content = message.content.strip().lower()
         author_mention = "<@!" + str(message.author.id) + ">"
 
-        # check if the message @s our bot and greets it. Respond with a random greeting
-        # didn't make this a separate command because this allows the bot to respond regardless
-        # of punctuation or where the greeting is placed in the message
-        if content.startswith(self.mention_id):
-            # check for greeting
-            greeting_patterns = "|".join(self.greetings)
-            if re.search(rf'\b({greeting_patterns})\b', content):
-                random_greeting = random.choice(self.greetings)
-                response = author_mention + " " + random_greeting + "!"
+        guild_id = message.guild.id if message.guild is not None else None
+        for trigger in self.triggers.match(content, guild_id):
+            logging.info(f"\"{trigger.name}\" trigger detected in message. Sending response.")
+            response = trigger.format_response(author_mention)
+            if trigger.action == "salute":
+                await self.salutes.send(message.channel, response)
+            else:
                 await message.channel.send(response)
 
-        if "trip" in content:
-            logging.info("\"trip\" detected in message. Sending response.")
-            salute = random.choice(os.listdir(self.salute_directory))
-            await message.channel.send(content=author_mention + " trip? triple? triplexlink?",
-                                       file=File(self.salute_directory + "/" + salute))
-
         # once we have checked the full message, process any commands that may be present
         await self.process_commands(message)
 
+    # gateway mode: session commands are run by the worker, which sends its replies back
+    async def invoke(self, ctx):
+        if self.worker is not None and ctx.command is not None and ctx.command.name in WORKER_COMMANDS:
+            logging.info(f"Passing {ctx.command.name} to the tracker worker.")
+            self.worker.run_command(ctx)
+            return
+        await super().invoke(ctx)
+
     # general command error catch-all
     async def on_command_error(self, ctx, error):
         if isinstance(error, CommandNotFound):
             logging.info(f"Command in message \"{ctx.message.content}\" not found. Ignoring.")
+        elif isinstance(error, CheckFailure):
+            logging.info(f"{ctx.author} isn't allowed to run {ctx.invoked_with}: {error}")
+            await ctx.channel.send("Sorry, you don't have permission to use that command.")
         else:
             logger.error(f"{ctx.invoked_with}: {error}")
             await ctx.channel.send("Sorry, error occurred when invoking command.")
 
     #################################    TASKS    #################################
 
-    # started and stopped via the start_wz and end_wz commands
-    @tasks.loop(minutes=8.0)  # turned from 10 -> 8 to account for faster Rebirth matches
+    # gateway mode: runs the worker process and delivers what it sends back. if the worker dies it is started
+    # again, and picks the sessions back up from disk
+    async def run_worker(self):
+        self.worker = WorkerProcess(self.debug)
+        while True:
+            self.worker.start()
+            self.worker.send_guilds(self.guilds)
+            await self.worker.receive(self.handle_worker_message)
+
+            logger.error(f"Tracker worker exited with code {self.worker.process.exitcode}. Restarting it.")
+            self.worker.restarts += 1
+            await asyncio.sleep(min(60, 2 ** self.worker.restarts))
+
+    async def handle_worker_message(self, message):
+        if message["type"] == "notify":
+            self.queue_notifications(message["notifications"])
+        elif message["type"] == "send":
+            channel = self.get_channel(message["channel_id"])
+            if channel is not None:
+                embed = Embed.from_dict(message["embed"]) if message["embed"] is not None else None
+                await channel.send(message["content"], embed=embed)
+
+    def send_guilds_to_worker(self):
+        if self.worker is not None and self.worker.is_alive():
+            self.worker.send_guilds(self.guilds)
+
+    # started when the first session starts and stopped when the last one ends. if it's already running, it's
+    # woken up to pick up the accounts of a session that just started
+    def start_tracker(self):
+        if self.tracker_task is not None:
+            self.tracker_wakeup.set()
+            return
+
+        # fresh pipeline each time so nothing left over from stopped sessions is still in flight
+        self.pipeline = TrackerPipeline(self.api, self.aggregate_match, self.queue_notifications)
+        self.pipeline.start()
+        self.tracker_wakeup = asyncio.Event()
+        self.tracker_task = self.loop.create_task(self.warzone_session_tracker())
+
+    def stop_tracker(self):
+        if self.tracker_task is not None:
+            self.tracker_task.cancel()
+            self.tracker_task = None
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+        self.pending_match_ids = set()
+        self.match_retries = {}
+
+    # each tracked account has its own PollScheduler that picks when it is polled next based on how recently
+    # it has been playing. first polls are staggered across the base interval so several accounts don't cause
+    # a burst of API calls at once. accounts are shared, so an account followed by several guilds is polled once
     async def warzone_session_tracker(self):
-        logging.info("Running Warzone Win Tracker loop")
+        next_polls = {}
+        while True:
+            # sessions start and end while the tracker runs, so the accounts to poll are checked every time
+            accounts = self.get_tracked_accounts()
+            for account in list(next_polls):
+                if account not in accounts:
+                    del next_polls[account]
+
+            now = time.time()
+            new_accounts = [account for account in accounts if account not in next_polls]
+            for i, account in enumerate(new_accounts):
+                scheduler = self.poll_schedulers.setdefault(account, PollScheduler())
+                next_polls[account] = now + i * scheduler.base_interval / len(new_accounts)
+
+            # sleep until the next poll is due, or until a session starts
+            self.tracker_wakeup.clear()
+            delay = min(next_polls.values()) - now if next_polls else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self.tracker_wakeup.wait(), timeout=delay)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+
+            username = min(next_polls, key=next_polls.get)
+            try:
+                with POLL_SECONDS.time(username):
+                    await self.track_account(username)
+            except Exception as e:
+                logger.exception(f"Win tracker run for {username} failed: {e}")
+                self.poll_schedulers[username].record_failure(str(e))
+
+            # no point polling while the API client is holding off (circuit breaker open or budget used up)
+            interval = max(self.poll_schedulers[username].get_interval(), self.api.get_retry_after())
+            next_polls[username] = time.time() + interval
+            logging.info(f"Next poll for {username} in {round(interval / 60, 2)} minutes "
+                         f"({self.poll_schedulers[username].get_last_decision()[2]})")
+
+    async def track_account(self, account):
+        logging.info(f"Running Warzone Win Tracker loop for {account}")
+        scheduler = self.poll_schedulers.setdefault(account, PollScheduler())
+        sessions = [session for session in self.get_active_sessions() if account in session.accounts]
+        if not sessions:
+            return
 
         try:
-            recent_matches = self.api.get_matches(self.cod_username)
+            recent_matches = await self.api.get_matches(account)
         except Exception as e:
             logger.error(f"Get Recent Matches call failed: {e}")
+            scheduler.record_failure(str(e))
             return
 
-        # uncomment to dump API data to debug
-        # with open("dump.json", "w") as f:
-        #   f.write(json.dumps(recent_matches, indent=4))
-        # return
-
-        matches_checked = 0
-
-        # the purpose of most_recent_match_id is to make sure we only process new matches added to the list
-        if self.most_recent_match_id is None:
-            self.most_recent_match_id = recent_matches[0]["matchID"]
-        elif recent_matches[0]["matchID"] != self.most_recent_match_id:  # there are new matches to process
-            for match in recent_matches:
-                current_id = match["matchID"]
-                if current_id == self.most_recent_match_id:  # we have processed all new matches in the list
-                    break
-
-                # get basic match data
-                placement = match["playerStats"]["teamPlacement"]
-                team = match["player"]["team"]
-                self.stat_tracker.update_cumulative_match_stats(placement)
-
-                # no API auth or response checks here - if we don't get the expected data, just skip
-                try:
-                    all_player_stats = self.api.get_match_details(current_id)
-                except Exception as e:
-                    logging.error(f"Match Details call failed: {e}")
-                    continue
-
-                # collect individual match stats to report in case of win
-                match_stats_dict = {}
-
-                # collect stats for all players on my Warzone team
-                for player in all_player_stats:
-                    if player["player"]["team"] == team:
-                        player_stats = player["playerStats"]
-                        username = player["player"]["username"]
-
-                        self.stat_tracker.update_cumulative_player_stats(username, player_stats)
-                        kills = player_stats["kills"]
-
-                        # collect stats for individual match
-                        match_stats_dict[username] = {
-                            "kills": kills,
-                            "deaths": player_stats["deaths"],
-                            "damage": player_stats["damageDone"]
-                        }
+        scheduler.record_success(recent_matches)
+        if not recent_matches:
+            return
 
-                        if kills >= 10:
-                            logging.info(f"Found a 10+ kill game for {username}. Sending congrats message.")
-                            discord_handle = self.stat_tracker._replace_player_name(username)
-                            await self.default_channels[self.server].send(f"Congrats to {discord_handle} who has achieved **{int(kills)} kills** in a single Warzone match!")
+        # matches that were played before every session following the account started are marked as seen
+        # without being counted
+        session_start = min(session.session_start_time for session in sessions)
+        new_matches = await self.collect_unseen_matches(account, recent_matches, session_start)
+
+        # matches whose details failed to fetch on an earlier poll go first, since they are older
+        retries = sorted((match for (match_account, match_id), (match, _) in self.match_retries.items()
+                          if match_account == account and (account, match_id) not in self.pending_match_ids),
+                         key=lambda match: match["utcStartSeconds"])
+
+        to_process = []
+        for match in new_matches:
+            if (account, match["matchID"]) in self.match_retries:
+                continue
+            if match["utcStartSeconds"] < session_start:
+                self.seen_matches.add(account, match["matchID"], match["utcStartSeconds"])
+            else:
+                to_process.append(match)
+
+        # hand new matches to the pipeline oldest first, followed by a marker that saves the seen index once
+        # they have all been aggregated
+        to_process = retries + sorted(to_process, key=lambda match: match["utcStartSeconds"])
+        for match in to_process:
+            self.pending_match_ids.add((account, match["matchID"]))
+            await self.pipeline.submit(account, match)
+
+        POLL_MATCHES.observe(len(to_process), account)
+        if to_process:
+            await self.pipeline.submit_cursor(account, None)
+        else:
+            self.seen_matches.save()
+        self.update_cache_metrics()
+        logging.info(f"Win tracker run complete. {len(to_process)} new matches queued.")
+
+    # copies the match cache's counters into the metrics registry. returns them as well
+    def update_cache_metrics(self):
+        stats = self.match_cache.get_stats()
+        for stat, value in stats.items():
+            MATCH_CACHE_STATS.set(value, stat)
+        return stats
+
+    # returns every match in the recent matches list that hasn't been seen yet (in any order).
+    # if none of them have been seen and the oldest one is newer than the last match seen for the account, more
+    # matches were played between polls than the list holds - older pages are fetched until we're caught up,
+    # and anything still missing after max_gap_pages is recorded as a gap to backfill. matches from before
+    # session_start are never counted, so paging stops there and they are never reported missing
+    async def collect_unseen_matches(self, account, recent_matches, session_start):
+        watermark = self.seen_matches.get_watermark(account)
+        new_matches = []
+        page = recent_matches
+        pages_fetched = 0
+        while True:
+            caught_up = False
+            for match in page:
+                match_id = match["matchID"]
+                if self.seen_matches.contains(account, match_id):
+                    caught_up = True
+                elif (account, match_id) not in self.pending_match_ids:
+                    new_matches.append(match)
+
+            oldest = min(match["utcStartSeconds"] for match in page)
+            if caught_up or watermark is None or oldest <= watermark or oldest < session_start:
+                return new_matches
+
+            if pages_fetched >= self.max_gap_pages:
+                watermark = max(watermark, session_start)
+                logger.warning(f"Matches for {account} may have been missed between {watermark} and {oldest}. "
+                               "Run backfill to recover them.")
+                # one span per account, widened by every poll that comes up short until a backfill covers it
+                gap = self.match_gaps.get(account)
+                if gap is not None:
+                    watermark, oldest = min(gap[0], watermark), max(gap[1], oldest)
+                self.match_gaps[account] = (watermark, oldest)
+                return new_matches
+
+            page = await self.api.get_matches(account, end=oldest * 1000)
+            pages_fetched += 1
+            if not page:
+                return new_matches
+
+    # aggregate stage of the tracker pipeline. applies one fetched and parsed match to every active session that
+    # follows the account (and hasn't counted the match yet), and returns the notifications that produced as
+    # (guild ID, content, salute)
+    def aggregate_match(self, job):
+        account = job.account
+        if job.match is None:
+            self.seen_matches.save()
+            return []
+
+        match = job.match
+        current_id = match["matchID"]
+        key = (account, current_id)
+        self.pending_match_ids.discard(key)
+
+        # the details couldn't be fetched - try again on a later poll rather than losing the player stats.
+        # (a retried match is counted after any newer ones processed in the meantime)
+        if job.team_stats is None and job.error is not None:
+            attempts = self.match_retries.get(key, (None, 0))[1] + 1
+            if attempts < self.max_match_attempts:
+                logging.info(f"Match {current_id} will be retried on the next poll (attempt {attempts}).")
+                self.match_retries[key] = (match, attempts)
+                return []
+            logger.error(f"Giving up on match details for {current_id} after {attempts} attempts.")
+        self.match_retries.pop(key, None)
+        self.seen_matches.add(account, current_id, match["utcStartSeconds"])
+
+        notifications = []
+        for session in self.get_active_sessions():
+            if account in session.accounts and current_id not in session.processed_match_ids \
+                    and match["utcStartSeconds"] >= session.session_start_time:
+                notifications.extend(self.apply_match(session, job))
+        return notifications
+
+    def apply_match(self, session, job):
+        match = job.match
+        current_id = match["matchID"]
+        stat_tracker = session.stat_tracker
+        session.processed_match_ids.add(current_id)
+        MATCHES_PROCESSED.inc()
+
+        # get basic match data
+        placement = match["playerStats"]["teamPlacement"]
+        stat_tracker.update_cumulative_match_stats(placement)
+
+        # the match details couldn't be fetched after several tries - just count the match
+        team_stats = job.team_stats if job.team_stats is not None else {}
+        notifications = []
+
+        # collect stats for all players on the tracked account's Warzone team
+        # and collect individual match stats to report in case of win
+        match_stats_dict = {}
+        for username, player_stats in team_stats.items():
+            stat_tracker.update_cumulative_player_stats(username, player_stats)
+            kills = player_stats["kills"]
+
+            match_stats_dict[username] = {
+                "kills": kills,
+                "deaths": player_stats["deaths"],
+                "damage": player_stats["damageDone"]
+            }
+
+            if kills >= 10:
+                logging.info(f"Found a 10+ kill game for {username}. Sending congrats message.")
+                discord_handle = self.gamertags.get_mention(username)
+                notifications.append((session.guild_id, f"Congrats to {discord_handle} who has achieved **{int(kills)} kills** in a single Warzone match!", False))
+
+        session.record_event({"type": "match", "match_id": current_id, "account": job.account,
+                              "placement": placement, "players": team_stats})
+        self.history.record_match(current_id, session.history_session_id, match["utcStartSeconds"],
+                                  match["utcEndSeconds"], placement, team_stats)
+
+        # if we won this match, send a congrats message to the channel
+        if placement == 1 and job.team_stats is not None:
+            logging.info(f"Warzone win found with ID {current_id}. Creating stats message.")
+            win_message = stat_tracker.format_win_message(match, match_stats_dict)
+            notifications.append((session.guild_id, win_message, True))
+            if stat_tracker.get_wins() % 3 == 0:
+                notifications.append((session.guild_id, "Ah shit, that's a triple dub. Good work team", False))
+
+        return notifications
+
+    # notify stage of the tracker pipeline. in worker mode, notifications are passed on to the gateway to send
+    def queue_notifications(self, notifications):
+        if self.gateway is not None:
+            self.gateway.send_notifications(notifications)
+            return
 
-                # if we won this match, send a congrats message to the channel
-                if placement == 1:
-                    logging.info(f"Warzone win found with ID {current_id}. Creating stats message.")
-                    salute = random.choice(os.listdir(self.salute_directory))
-                    win_message = self.stat_tracker.format_win_message(match, match_stats_dict)
+        for guild_id, content, salute in notifications:
+            channel = self.channel_registry.get_channel(guild_id)
+            if channel is None:
+                logger.error(f"No tracker channel found for guild {guild_id}. Dropping notification.")
+                continue
+            self.dispatcher.queue(channel, content, salute=salute)
 
-                    await self.default_channels[self.server].send(content=win_message,
-                                                                  file=File(self.salute_directory + "/" + salute))
-                    if self.stat_tracker.get_wins() % 3 == 0:
-                        await self.default_channels[self.server].send("Ah shit, that's a triple dub. Good work team")
-                matches_checked += 1
+    async def run_backfill(self, channel, account, max_requests):
+        backfill = Backfill(self.api, self.history, account, self.backfill_dir, max_requests=max_requests)
+        try:
+            result = await backfill.run()
+        except Exception as e:
+            logger.error(f"Backfill for {account} failed: {e}")
+            await channel.send(f"Backfill for {account} failed. Run it again to resume.")
+            return
+        finally:
+            self.backfill_tasks.pop(account, None)
+
+        if result == "finished":
+            gap = self.match_gaps.get(account)
+            if gap is not None and backfill.covers(*gap):
+                del self.match_gaps[account]
+            await channel.send(f"Backfill finished. {backfill.get_status()}")
+        else:
+            # out of requests, or some match details couldn't be fetched and are waiting to be retried
+            await channel.send(f"Backfill paused. {backfill.get_status()}. Run it again to resume.")
 
-            # update most recent match ID to avoid re-processing any matches
-            self.most_recent_match_id = recent_matches[0]["matchID"]
+    async def run_clear(self, clear, status_message):
+        progress_task = self.loop.create_task(report_progress(clear, status_message))
+        try:
+            await clear.run()
+            result = f"Cleared #{clear.channel}. {clear.get_progress()}"
+        except asyncio.CancelledError:
+            result = f"Stopped clearing #{clear.channel}. {clear.get_progress()}"
+        except Exception as e:
+            logger.exception(f"Clearing #{clear.channel} failed: {e}")
+            result = f"Clearing #{clear.channel} failed. {clear.get_progress()}"
+        finally:
+            progress_task.cancel()
+            self.clear_tasks.pop(clear.channel.id, None)
 
-        logging.info(f"Win tracker run complete. {matches_checked} recent matches checked.")
+        logging.info(result)
+        await status_message.edit(content=result)
 
     #################################    COMMANDS    #################################
 
-    # start a new Warzone session
-    # can only be invoked in private test server
+    # start a new Warzone session for this guild (or the guild its config points at)
+    # can only be invoked in guilds allowed to manage sessions
     @command(name="start_wz")
     async def start_wz(ctx, use_existing_stats=None):
-        if ctx.guild.name != "Bot Test Server":
-            logging.info("start_wz command invoked in normal server. Ignoring.")
+        if not ctx.bot.get_guild_settings(ctx.guild)["manage_sessions"]:
+            logging.info(f"start_wz command invoked in {ctx.guild.name}, which can't manage sessions. Ignoring.")
             return
 
-        if ctx.bot.session_active:
+        session = ctx.bot.get_session(ctx.guild, create=True)
+        if session is None:
+            logging.info("start_wz command invoked, but the session's guild couldn't be found.")
+            await ctx.channel.send("The server this session belongs to couldn't be found.")
+            return
+
+        if session.session_active:
             logging.info("start_wz command invoked, but there is already an active session.")
             await ctx.channel.send("There is already an active session.")
             return
 
-        logging.info("Starting Warzone session.")
+        logging.info(f"Starting Warzone session for guild {session.guild_id}.")
+
+        start_time = time.time()
+        continue_session = use_existing_stats == "-c"
 
-        if use_existing_stats != "-c":
-            ctx.bot.stat_tracker = StatTracker()
+        # a continued session keeps adding to the same session in the stats history
+        history_session_id = session.history_session_id
+        if not continue_session or history_session_id is None:
+            history_session_id = ctx.bot.history.start_session(start_time, session.guild_id)
 
-        ctx.bot.warzone_session_tracker.start()
-        ctx.bot.stat_tracker.set_start_time(time.localtime())
-        ctx.bot.session_active = True
+        start_event = {"type": "start", "time": start_time, "continue": continue_session,
+                       "history_session_id": history_session_id, "accounts": session.accounts}
+        session.apply_event(start_event)
+        session.record_event_and_snapshot(start_event)
+
+        ctx.bot.start_tracker()
         await ctx.channel.send("Warzone tracker started. Good luck, team.")
 
-    # end a Warzone session and reset.
-    # can only be invoked in private test server
+    # end this guild's Warzone session and reset. the tracker keeps running while other guilds have sessions
+    # can only be invoked in guilds allowed to manage sessions
     @command(name="end_wz")
     async def end_wz(ctx):
-        if ctx.guild.name != "Bot Test Server":
-            logging.info("end_wz command invoked in normal server. Ignoring.")
+        if not ctx.bot.get_guild_settings(ctx.guild)["manage_sessions"]:
+            logging.info(f"end_wz command invoked in {ctx.guild.name}, which can't manage sessions. Ignoring.")
             return
 
-        if not ctx.bot.session_active:
+        session = ctx.bot.get_session(ctx.guild)
+        if session is None or not session.session_active:
             logging.info("end_wz command invoked, but there is currently no active session.")
             await ctx.channel.send("There is currently no active session to end.")
             return
 
-        logging.info("Warzone session has ended. Stopping tracker.")
-        ctx.bot.warzone_session_tracker.cancel()
-        ctx.bot.session_active = False
-
-        if ctx.bot.stat_tracker.get_num_matches() == 0:
+        logging.info(f"Warzone session for guild {session.guild_id} has ended.")
+        end_event = {"type": "end", "time": time.time()}
+        stat_tracker = session.stat_tracker
+        ctx.bot.history.end_session(session.history_session_id, end_event["time"])
+        ctx.bot.history.save_session_sketches(session.history_session_id,
+                                              {username: stat_tracker.get_player_sketches(username)
+                                               for username in stat_tracker.get_usernames()})
+        session.apply_event(end_event)
+        session.record_event_and_snapshot(end_event)
+
+        if not ctx.bot.get_active_sessions():
+            logging.info("No active sessions left. Stopping tracker.")
+            ctx.bot.stop_tracker()
+
+        if stat_tracker.get_num_matches() == 0:
             await ctx.channel.send("Warzone tracker stopped. No matches were played.")
         else:
             await ctx.channel.send("Warzone tracker stopped. Good work out there.")
 
-    # return team's cumulative stats
+    # ingest an account's past matches into the stats history. resumes from the last checkpoint if interrupted
+    # can only be invoked in guilds allowed to manage sessions
+    @command(name="backfill")
+    async def backfill(ctx, account=None, max_requests="200"):
+        settings = ctx.bot.get_guild_settings(ctx.guild)
+        if not settings["manage_sessions"]:
+            logging.info(f"backfill command invoked in {ctx.guild.name}, which can't manage sessions. Ignoring.")
+            return
+
+        account = account or (settings["accounts"] or ctx.bot.cod_usernames)[0]
+        if account in ctx.bot.backfill_tasks:
+            await ctx.channel.send(f"A backfill for {account} is already running.")
+            return
+
+        logging.info(f"Starting backfill for {account}.")
+        ctx.bot.backfill_tasks[account] = ctx.bot.loop.create_task(
+            ctx.bot.run_backfill(ctx.channel, account, int(max_requests)))
+        await ctx.channel.send(f"Backfill started for {account} (up to {max_requests} requests).")
+
+    # report when each tracked account will be polled next and why
+    @command(name="tracker_status")
+    async def tracker_status(ctx):
+        if not ctx.bot.get_active_sessions():
+            await ctx.channel.send("There is currently no active session.")
+            return
+
+        status = f"**Tracker Status** ({len(ctx.bot.get_active_sessions())} active sessions)\n"
+        for username in ctx.bot.get_tracked_accounts():
+            scheduler = ctx.bot.poll_schedulers.get(username)
+            if scheduler is None:
+                status += f"    • {username}: waiting for first poll\n"
+                continue
+            decision = scheduler.get_last_decision()
+            reason = decision[2] if decision else "waiting for first poll"
+            status += f"    • {username}: every {round(scheduler.get_interval() / 60, 2)} minutes ({reason})\n"
+
+        api_status = ctx.bot.api.get_status()
+        status += f"**Warzone API**: circuit {api_status['circuit']}, {api_status['requests_last_hour']}/" \
+                  f"{api_status['hourly_budget']} requests in the last hour, {api_status['retries']} retries, " \
+                  f"{len(ctx.bot.match_retries)} matches waiting to be retried\n"
+        if api_status["last_error"] is not None:
+            status += f"    • last error: {api_status['last_error'][:200]}\n"
+
+        cache_stats = ctx.bot.update_cache_metrics()
+        status += f"**Match Cache**: {cache_stats['hits']} hits, {cache_stats['misses']} misses, " \
+                  f"{cache_stats['entries']} matches ({round(cache_stats['bytes'] / 1024 / 1024, 1)} MB)\n"
+
+        if ctx.bot.match_gaps:
+            status += "**Possible Missed Matches** (run !backfill to recover)\n"
+            for account, (gap_start, gap_end) in ctx.bot.match_gaps.items():
+                status += f"    • {account}: {time.strftime('%m/%d %H:%M', time.localtime(gap_start))} - " \
+                          f"{time.strftime('%m/%d %H:%M', time.localtime(gap_end))}\n"
+
+        if ctx.bot.pipeline is not None:
+            status += "**Pipeline**\n"
+            for stage, stats in ctx.bot.pipeline.get_stats().items():
+                status += f"    • {stage}: {stats['processed']} processed, {stats['queue_depth']} queued, " \
+                          f"{stats['avg_ms']} ms avg, {stats['errors']} errors\n"
+
+        logging.info("tracker_status successfully invoked. Sending message.")
+        await send_paged(ctx.channel, status, "Tracker Status")
+
+    # summary of the metrics served on the Prometheus endpoint
+    @command(name="metrics")
+    async def metrics(ctx):
+        lines = [("Warzone API requests", "wz_api_request_seconds"), ("Tracker polls", "tracker_poll_seconds"),
+                 ("Discord sends", "discord_send_seconds"), ("on_message", "on_message_seconds"),
+                 ("Event loop lag", "event_loop_lag_seconds")]
+
+        message = "**Metrics**\n"
+        for label, name in lines:
+            total, count = registry.get(name).get_totals()
+            if count == 0:
+                message += f"    • {label}: no data\n"
+                continue
+            message += f"    • {label}: {count} recorded, {round(total / count * 1000, 1)} ms avg, " \
+                       f"p95 {_format_bound(registry.get(name).quantile(0.95))}\n"
+
+        total, count = registry.get("tracker_poll_matches").get_totals()
+        message += f"    • Matches processed: {sum(MATCHES_PROCESSED.values.values())} " \
+                   f"({round(total / count, 2) if count else 0} new per poll)\n"
+
+        logging.info("metrics successfully invoked. Sending message.")
+        await ctx.channel.send(message)
+
+    # sample the event loop for a while and send back where the time went. bot owner only
+    @command(name="profile")
+    @is_owner()
+    async def profile(ctx, seconds="30"):
+        seconds = min(float(seconds), 300)
+        if ctx.bot.profiler.running:
+            await ctx.channel.send("A profile is already running.")
+            return
+
+        logging.info(f"Profiling the event loop for {seconds} seconds.")
+        await ctx.channel.send(f"Profiling for {seconds} seconds.")
+        report = await ctx.bot.profiler.profile(seconds)
+        report += f"\nEvent loop stalls over {ctx.bot.watchdog.threshold}s since startup: {ctx.bot.watchdog.stalls}\n"
+        await ctx.channel.send("Profile complete.", file=File(io.BytesIO(report.encode()), filename="profile.txt"))
+
+    # return team's cumulative stats. "!session_stats last" returns the stats of the last finished session
     @command(name="session_stats")
-    async def session_stats(ctx):
-        if ctx.bot.stat_tracker.get_num_matches() == 0:
+    async def session_stats(ctx, which=None):
+        session = ctx.bot.get_session(ctx.guild)
+        if which == "last":
+            guild_id = session.guild_id if session is not None else ctx.guild.id
+            session_id = ctx.bot.history.get_last_session_id(guild_id)
+            past_session = ctx.bot.history.get_session(session_id) if session_id is not None else None
+            if past_session is None:
+                logging.info("session_stats last invoked, but no previous session was found.")
+                await ctx.channel.send("No previous session found.")
+                return
+
+            logging.info("session_stats last successfully invoked. Sending message.")
+            await ctx.channel.send(StatTracker(ctx.bot.gamertags).format_past_session_stats(past_session))
+            return
+
+        if session is None or session.stat_tracker.get_num_matches() == 0:
             logging.info("session_stats command invoked, but no matches have been played.")
             await ctx.channel.send("No matches have been played.")
             return
 
-        formatted_stats = ctx.bot.stat_tracker.format_session_stats()
+        formatted_stats = session.stat_tracker.format_session_stats()
         logging.info("session_stats successfully invoked. Sending message.")
-        await ctx.channel.send(formatted_stats)
+        await send_paged(ctx.channel, formatted_stats, "Session Stats")
 
     # return cumulative stats of an individual player
+    # with a time window (e.g. "!player_stats bglowniak 30d", "4w" or "all"), stats come from the full match history instead
     @command(name="player_stats")
-    async def player_stats(ctx, username_arg=None):
-        if ctx.bot.stat_tracker.get_num_matches() == 0:
+    async def player_stats(ctx, username_arg=None, window_arg=None):
+        if username_arg is not None and window_arg is not None:
+            sketches = None
+            if window_arg == "all":
+                days = None
+                sketches = ctx.bot.history.get_all_time_sketches(username_arg)
+            else:
+                days = parse_window(window_arg)
+                if days is None or days == 0:
+                    await ctx.channel.send("Time window should look like 30d, 4w or all.")
+                    return
+
+            stats = ctx.bot.history.get_player_window(username_arg, days)
+            if stats is None:
+                logging.info("player_stats command invoked with a window, but no stats were found.")
+                await ctx.channel.send("No stats to report.")
+                return
+
+            logging.info("player_stats successfully invoked with a window. Sending message.")
+            await ctx.channel.send(StatTracker(ctx.bot.gamertags).format_window_stats(username_arg, days, stats, sketches))
+            return
+
+        session = ctx.bot.get_session(ctx.guild)
+        if session is None or session.stat_tracker.get_num_matches() == 0:
             logging.info("player_stats command invoked, but no matches have been played.")
             await ctx.channel.send("No matches have been played.")
             return
 
+        stat_tracker = session.stat_tracker
         if username_arg is None:
             formatted_stats = ""
-            for player in ctx.bot.stat_tracker.get_usernames():
-                formatted_stats += ctx.bot.stat_tracker.format_individual_stats(player) + "\n"
+            for player in stat_tracker.get_usernames():
+                formatted_stats += stat_tracker.format_individual_stats(player) + "\n"
         else:
-            formatted_stats = ctx.bot.stat_tracker.format_individual_stats(username_arg)
+            formatted_stats = stat_tracker.format_individual_stats(username_arg)
 
         if formatted_stats:
             logging.info("player_stats successfully invoked. Sending message.")
-            await ctx.channel.send(formatted_stats)
+            await send_paged(ctx.channel, formatted_stats, "Player Stats")
         else:
             logging.info("player_stats command invoked, but no stats were found.")
             await ctx.channel.send("No stats to report.")
 
     @command(name="awards")
     async def awards(ctx):
-        if ctx.bot.stat_tracker.get_num_matches() == 0:
+        session = ctx.bot.get_session(ctx.guild)
+        if session is None or session.stat_tracker.get_num_matches() == 0:
             logging.info("Awards command invoked, but no matches have been played.")
             await ctx.channel.send("No matches have been played.")
             return
 
-        awards_message = ctx.bot.stat_tracker.format_awards()
+        awards_message = session.stat_tracker.format_awards()
         logging.info("Awards successfully invoked. Sending message.")
-        await ctx.channel.send(awards_message)
+        await send_paged(ctx.channel, awards_message, "Awards")
+
+    # link a gamertag to yourself (or, for the bot owner, to the @'d user) so the bot mentions you in messages
+    @command(name="link")
+    async def link(ctx, gamertag=None, member=None):
+        if gamertag is None:
+            gamertags = ctx.bot.gamertags.get_gamertags(ctx.author.id)
+            linked = ", ".join(gamertags) if gamertags else "none"
+            await ctx.channel.send(f"Usage: !link <gamertag>. Your linked gamertags: {linked}")
+            return
+
+        user = ctx.author
+        if member is not None:
+            # the bot itself is mentioned too when it's invoked with an @mention instead of the prefix
+            mentions = [mentioned for mentioned in ctx.message.mentions if mentioned != ctx.bot.user]
+            if not await ctx.bot.is_owner(ctx.author) or not mentions:
+                await ctx.channel.send("Only the bot owner can link gamertags for someone else.")
+                return
+            user = mentions[0]
+
+        previous = ctx.bot.gamertags.get_discord_id(gamertag)
+        if previous is not None and previous != user.id and not await ctx.bot.is_owner(ctx.author):
+            await ctx.channel.send(f"{gamertag} is already linked to someone else.")
+            return
+
+        ctx.bot.gamertags.link(gamertag, user.id)
+        logging.info(f"Linked {gamertag} to {user} ({user.id}).")
+        await ctx.channel.send(f"Linked {gamertag} to {user.display_name}.")
+
+    # remove a gamertag's link. anyone can unlink their own gamertags, the bot owner can unlink any
+    @command(name="unlink")
+    async def unlink(ctx, gamertag=None):
+        if gamertag is None:
+            await ctx.channel.send("Usage: !unlink <gamertag>")
+            return
+
+        discord_id = ctx.bot.gamertags.get_discord_id(gamertag)
+        if discord_id is None:
+            await ctx.channel.send(f"{gamertag} isn't linked to anyone.")
+            return
+        if discord_id != ctx.author.id and not await ctx.bot.is_owner(ctx.author):
+            await ctx.channel.send(f"{gamertag} is linked to someone else.")
+            return
 
+        ctx.bot.gamertags.unlink(gamertag)
+        logging.info(f"Unlinked {gamertag} from {discord_id}.")
+        await ctx.channel.send(f"Unlinked {gamertag}.")
+
+    # clear out messages in the channel of invocation, optionally only some of them (see parse_clear_args).
+    # runs in the background with a progress message. "!clear_channel stop" cancels a running clear.
+    # only for members who could delete the messages themselves
     @command(name="clear_channel")
-    async def clear_channel(ctx):
+    @has_permissions(manage_messages=True)
+    async def clear_channel(ctx, *args):
+        task = ctx.bot.clear_tasks.get(ctx.channel.id)
+        if args and args[0].lower() in ("stop", "cancel"):
+            if task is None:
+                await ctx.channel.send("No clear is running in this channel.")
+            else:
+                logging.info(f"Cancelling clear of #{ctx.channel} in {ctx.guild.name}")
+                task.cancel()
+            return
+
+        if task is not None:
+            await ctx.channel.send("This channel is already being cleared. Use !clear_channel stop to cancel it.")
+            return
+
+        mention_ids = [user.id for user in ctx.message.mentions if user != ctx.bot.user]
+        filters, error = parse_clear_args(args, mention_ids)
+        if error is not None:
+            await ctx.channel.send(error)
+            return
+
         logging.info(f"Clearing #{ctx.channel} in {ctx.guild.name}")
-        await ctx.channel.purge()
+        status_message = await ctx.channel.send(f"Clearing #{ctx.channel}...")
+        clear = ChannelClear(ctx.channel, skip_ids=(status_message.id,), **filters)
+        ctx.bot.clear_tasks[ctx.channel.id] = ctx.bot.loop.create_task(ctx.bot.run_clear(clear, status_message))
+
+
+# histogram bucket bound in seconds -> readable string
+def _format_bound(bound):
+    if bound == float("inf"):
+        return "above the largest bucket"
+    return f"<= {round(bound * 1000)} ms" if bound < 1 else f"<= {bound} s"
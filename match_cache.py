@@ -0,0 +1,100 @@
+import json
+import sqlite3
+import time
+import zlib
+
+
+# persistent single-file cache for Warzone API responses
+# finished matches never change, so fullMatch payloads are kept until they age out or the cache grows too large.
+# recent match lists do change, so they are only reused for a short window (enough to dedupe calls within a poll)
+class MatchCache():
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, max_age_days=90, matches_ttl=60):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.matches_ttl = matches_ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS match_details ("
+                        "match_id TEXT PRIMARY KEY, payload BLOB, size INTEGER, fetched_at REAL, last_used REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS match_details_last_used ON match_details (last_used)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS recent_matches ("
+                        "username TEXT PRIMARY KEY, payload BLOB, fetched_at REAL)")
+        self.db.commit()
+        self.evict()
+
+    def get_match_details(self, match_id):
+        row = self.db.execute("SELECT payload FROM match_details WHERE match_id = ?", (match_id,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.db.execute("UPDATE match_details SET last_used = ? WHERE match_id = ?", (time.time(), match_id))
+        self.db.commit()
+        return zlib.decompress(row[0])
+
+    # match details are stored as the raw (compressed) response body so they can be parsed lazily on the way out
+    def put_match_details(self, match_id, raw):
+        payload = zlib.compress(raw)
+        now = time.time()
+        self.db.execute("INSERT OR REPLACE INTO match_details VALUES (?, ?, ?, ?, ?)",
+                        (match_id, payload, len(payload), now, now))
+        self.db.commit()
+        self.evict()
+
+    def get_matches(self, username):
+        row = self.db.execute("SELECT payload, fetched_at FROM recent_matches WHERE username = ?", (username,)).fetchone()
+        if row is None or time.time() - row[1] > self.matches_ttl:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return self._decode(row[0])
+
+    def put_matches(self, username, matches):
+        self.db.execute("INSERT OR REPLACE INTO recent_matches VALUES (?, ?, ?)",
+                        (username, self._encode(matches), time.time()))
+        self.db.commit()
+
+    # drop anything past the max age, then the least recently used match details until we are under max_bytes
+    def evict(self):
+        cutoff = time.time() - self.max_age
+        self.db.execute("DELETE FROM match_details WHERE fetched_at < ?", (cutoff,))
+        self.db.execute("DELETE FROM recent_matches WHERE fetched_at < ?", (cutoff,))
+
+        total_size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM match_details").fetchone()[0]
+        if total_size > self.max_bytes:
+            to_free = total_size - self.max_bytes
+            freed = 0
+            evicted = []
+            for match_id, size in self.db.execute("SELECT match_id, size FROM match_details ORDER BY last_used"):
+                evicted.append((match_id,))
+                freed += size
+                if freed >= to_free:
+                    break
+            self.db.executemany("DELETE FROM match_details WHERE match_id = ?", evicted)
+
+        self.db.commit()
+
+    def get_stats(self):
+        entries, total_size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM match_details").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": total_size
+        }
+
+    def close(self):
+        self.db.close()
+
+    def _encode(self, data):
+        return zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+
+    def _decode(self, payload):
+        return json.loads(zlib.decompress(payload))
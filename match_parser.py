@@ -0,0 +1,66 @@
+import json
+
+from stat_tracker import PLAYER_METRICS
+
+# orjson is much faster than the stdlib decoder, but optional
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(raw):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+# compact record for one player in a match, holding only the stats we track
+class PlayerRow():
+    __slots__ = ("username", "team") + tuple(PLAYER_METRICS)
+
+    def __init__(self, player, player_stats):
+        self.username = player["username"]
+        self.team = player["team"]
+        for metric, field in PLAYER_METRICS.items():
+            setattr(self, metric, player_stats[field])
+
+    # playerStats-style dict (API field names), as used by StatTracker and the session log
+    def to_player_stats(self):
+        return {field: getattr(self, metric) for metric, field in PLAYER_METRICS.items()}
+
+
+# parses a fullMatch response body and returns PlayerRows for one team only.
+# with the stdlib decoder, player objects are intercepted as soon as they are decoded, so the other ~146 players
+# in the lobby are dropped right away instead of all being kept in one big list. with orjson the whole body is
+# decoded in C (which is faster still) and only the team's rows are kept
+def parse_team_rows(raw, team):
+    if orjson is not None:
+        data = orjson.loads(raw)
+        _check_status(data)
+        return [PlayerRow(player["player"], player["playerStats"]) for player in data["data"]["allPlayers"]
+                if player["player"]["team"] == team]
+
+    rows = []
+
+    def object_hook(pairs):
+        player = player_stats = None
+        for key, value in pairs:
+            if key == "player":
+                player = value
+            elif key == "playerStats":
+                player_stats = value
+
+        # not a player entry (or it's the nested "player" object itself)
+        if player is None or player_stats is None or not isinstance(player, dict):
+            return dict(pairs)
+
+        if player.get("team") == team:
+            rows.append(PlayerRow(player, player_stats))
+        return None
+
+    _check_status(json.loads(raw, object_pairs_hook=object_hook))
+    return rows
+
+
+def _check_status(data):
+    if data.get("status") != "success":
+        raise Exception(f"API returned 200 status code but there was an unknown error. API responded with {data}")
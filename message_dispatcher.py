@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from discord import Embed
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 2000
+SALUTE_URL_ROOM = 300  # room left in messages with a salute for SaluteMedia to append a cached CDN link
+MAX_EMBED_DESCRIPTION_LENGTH = 2048
+
+
+# fixed window rate limiter matching Discord's per-channel message bucket (5 messages per 5 seconds)
+class RateLimiter():
+    def __init__(self, rate=5, per=5.0):
+        self.rate = rate
+        self.per = per
+        self.sent = deque()
+
+    async def wait(self):
+        now = time.monotonic()
+        while self.sent and now - self.sent[0] >= self.per:
+            self.sent.popleft()
+
+        if len(self.sent) >= self.rate:
+            await asyncio.sleep(self.per - (now - self.sent[0]))
+            self.sent.popleft()
+
+        self.sent.append(time.monotonic())
+
+
+# queues outbound notifications per channel so the tracker never waits on Discord.
+# each channel has a worker that waits coalesce_delay after the first notification arrives, merges everything
+# queued by then (e.g. all the congrats/win messages from one poll) into as few messages as fit in Discord's
+# 2000 character limit, and paces sends against the channel's rate limit
+class MessageDispatcher():
+    def __init__(self, send_fn, coalesce_delay=1.0):
+        self.send_fn = send_fn  # async send_fn(channel, content, salute)
+        self.coalesce_delay = coalesce_delay
+        self.queues = {}  # channel ID -> asyncio.Queue of (content, salute)
+        self.workers = {}
+        self.limiters = {}
+
+    def queue(self, channel, content, salute=False):
+        if channel.id not in self.queues:
+            self.queues[channel.id] = asyncio.Queue()
+            self.limiters[channel.id] = RateLimiter()
+            self.workers[channel.id] = asyncio.get_event_loop().create_task(self._worker(channel))
+
+        self.queues[channel.id].put_nowait((content, salute))
+
+    def close(self):
+        for worker in self.workers.values():
+            worker.cancel()
+        self.workers = {}
+        self.queues = {}
+
+    async def _worker(self, channel):
+        queue = self.queues[channel.id]
+        limiter = self.limiters[channel.id]
+        while True:
+            items = [await queue.get()]
+            await asyncio.sleep(self.coalesce_delay)
+            while not queue.empty():
+                items.append(queue.get_nowait())
+
+            for content, salute in self._coalesce(items):
+                await limiter.wait()
+                try:
+                    await self.send_fn(channel, content, salute)
+                except Exception as e:
+                    logger.error(f"Failed to send message to #{channel}: {e}")
+
+    # merges notifications in order into as few messages as possible. a message carries at most one salute
+    def _coalesce(self, items):
+        messages = []
+        current = None
+        current_salute = False
+        for content, salute in items:
+            if current is not None:
+                merged_salute = current_salute or salute
+                limit = MAX_MESSAGE_LENGTH - (SALUTE_URL_ROOM if merged_salute else 0)
+                if not (salute and current_salute) and len(current) + 2 + len(content) <= limit:
+                    current = current + "\n\n" + content
+                    current_salute = merged_salute
+                    continue
+                messages.append((current, current_salute))
+
+            current = content
+            current_salute = salute
+
+        if current is not None:
+            messages.append((current, current_salute))
+        return messages
+
+
+# splits text into pages of at most limit characters, breaking between lines where possible
+def split_pages(text, limit):
+    pages = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:  # a single line too long for a page gets cut
+            if current:
+                pages.append(current)
+                current = ""
+            pages.append(line[:limit])
+            line = line[limit:]
+
+        if len(current) + len(line) > limit:
+            pages.append(current)
+            current = ""
+        current += line
+
+    if current:
+        pages.append(current)
+    return [page.rstrip("\n") for page in pages]
+
+
+# sends a reply as a normal message if it fits, otherwise as numbered embed pages
+async def send_paged(channel, text, title):
+    if not text:
+        return await channel.send("No stats to report.")
+    if len(text) <= MAX_MESSAGE_LENGTH:
+        return await channel.send(text)
+
+    pages = split_pages(text, MAX_EMBED_DESCRIPTION_LENGTH)
+    for i, page in enumerate(pages):
+        await channel.send(embed=Embed(title=f"{title} ({i + 1}/{len(pages)})", description=page))
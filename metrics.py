@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# seconds. covers everything from a cached lookup to a slow API call that hits the 30 second timeout
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+# a minimal in-process metrics registry that renders the Prometheus text format, so the bot doesn't need the
+# prometheus_client dependency. every metric is keyed by a tuple of label values
+class Counter():
+    type = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value, *label_values):
+        self.values[label_values] = value
+
+
+class Histogram():
+    type = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [bucket counts (last one is +Inf), sum, count]
+
+    def observe(self, value, *label_values):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    # context manager that observes the time spent inside it
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+    # upper bound of the bucket the q quantile falls in, across every label combination
+    def quantile(self, q):
+        counts = [0] * (len(self.buckets) + 1)
+        for bucket_counts, _, _ in self.values.values():
+            counts = [total + count for total, count in zip(counts, bucket_counts)]
+        total = sum(counts)
+        if total == 0:
+            return None
+
+        running = 0
+        for i, count in enumerate(counts):
+            running += count
+            if running >= q * total:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+
+    def get_totals(self):
+        return (sum(series[1] for series in self.values.values()),
+                sum(series[2] for series in self.values.values()))
+
+    def render(self):
+        lines = []
+        for key, (bucket_counts, total, count) in self.values.items():
+            running = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), bucket_counts):
+                running += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + (bound,))} {running}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class _Timer():
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+class MetricsRegistry():
+    def __init__(self):
+        self.metrics = {}
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def get(self, name):
+        return self.metrics.get(name)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            return self.metrics[metric.name]
+        self.metrics[metric.name] = metric
+        return metric
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# shared by every module, the same way prometheus_client's default registry is
+registry = MetricsRegistry()
+
+LOOP_LAG = registry.histogram("event_loop_lag_seconds", "How late the event loop woke up a sleeping task",
+                              buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5))
+
+
+# sleeps for interval over and over, and records how much later than asked the loop woke it up. anything that
+# blocks the loop (slow parsing, blocking I/O, ...) shows up here
+async def monitor_loop_lag(interval=1.0):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+# serves the registry in the Prometheus text format at http://host:port/metrics
+async def start_metrics_server(host, port):
+    async def handle_metrics(request):
+        return web.Response(text=registry.render(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,78 @@
+import random
+import statistics
+import time
+from collections import deque
+
+
+# decides how long to wait before polling an account again, based on how recently it has been playing.
+# during active play the next poll is lined up with when the next match should end, when the account goes
+# idle the interval grows towards max_interval, and API errors back off exponentially (with jitter)
+class PollScheduler():
+    def __init__(self, base_interval=8 * 60, min_interval=2 * 60, max_interval=30 * 60,
+                 idle_after=45 * 60, max_backoff=60 * 60, slack=60):
+        self.base_interval = base_interval  # used until we have seen enough matches to estimate cadence
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_after = idle_after  # no match ending within this window means nobody is playing
+        self.max_backoff = max_backoff
+        self.slack = slack  # extra time after the expected match end for the API to catch up
+
+        self.interval = base_interval
+        self.consecutive_errors = 0
+        self.decisions = deque(maxlen=20)  # (timestamp, interval, reason) of the most recent decisions
+
+    def get_interval(self):
+        return self.interval
+
+    def get_last_decision(self):
+        return self.decisions[-1] if self.decisions else None
+
+    # pick the next interval from the recent matches list returned by get_matches
+    def record_success(self, recent_matches, now=None):
+        now = time.time() if now is None else now
+        self.consecutive_errors = 0
+
+        end_times = sorted(match["utcEndSeconds"] for match in recent_matches if match.get("utcEndSeconds"))
+        if not end_times:
+            return self._decide(self.base_interval, "no recent matches")
+
+        since_last_end = now - end_times[-1]
+        if since_last_end > self.idle_after:
+            # grow the interval gradually so a quick return to play is still picked up reasonably fast
+            interval = min(self.max_interval, max(self.base_interval, self.interval * 1.5))
+            return self._decide(interval, f"idle for {round(since_last_end / 60)} minutes")
+
+        cadence = self._estimate_cadence(recent_matches, end_times, now)
+        if cadence is None:
+            return self._decide(self.base_interval, "active, not enough matches to estimate cadence")
+
+        expected_next_end = end_times[-1] + cadence
+        interval = expected_next_end + self.slack - now
+        interval = min(self.base_interval, max(self.min_interval, interval))
+        return self._decide(interval, f"active, matches finishing every ~{round(cadence / 60, 1)} minutes")
+
+    def record_failure(self, reason, now=None):
+        self.consecutive_errors += 1
+        backoff = min(self.max_backoff, self.base_interval * 2 ** (self.consecutive_errors - 1))
+        # equal jitter so several accounts failing together don't all retry at the same moment
+        interval = backoff / 2 + random.uniform(0, backoff / 2)
+        return self._decide(interval, f"error #{self.consecutive_errors}: {reason}", now)
+
+    # typical time between the ends of consecutive matches in the current play session
+    def _estimate_cadence(self, recent_matches, end_times, now):
+        session_ends = [end for end in end_times if now - end <= 4 * 60 * 60]
+        gaps = [later - earlier for earlier, later in zip(session_ends, session_ends[1:])
+                if later - earlier <= self.idle_after]
+        if gaps:
+            return statistics.median(gaps)
+
+        # only one match this session so far - fall back to how long matches usually last
+        durations = [match["utcEndSeconds"] - match["utcStartSeconds"] for match in recent_matches
+                     if match.get("utcEndSeconds") and match.get("utcStartSeconds")]
+        return statistics.median(durations) if durations else None
+
+    def _decide(self, interval, reason, now=None):
+        now = time.time() if now is None else now
+        self.interval = interval
+        self.decisions.append((now, interval, reason))
+        return interval
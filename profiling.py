@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+# statistical profiler for the event loop thread. a background thread grabs the loop thread's stack every
+# interval seconds while it's running, so the bot itself isn't slowed down the way cProfile would slow it.
+# nothing runs at all when no profile has been asked for
+class SamplingProfiler():
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = Counter()  # function -> samples where it was the one running
+        self.total_counts = Counter()  # function -> samples where it was anywhere on the stack
+        self.running = False
+
+    # profiles the calling (event loop) thread for duration seconds and returns the report
+    async def profile(self, duration):
+        if self.running:
+            raise RuntimeError("A profile is already running.")
+
+        self.running = True
+        self.samples = 0
+        self.self_counts = Counter()
+        self.total_counts = Counter()
+        thread = threading.Thread(target=self._sample, args=(threading.get_ident(), time.monotonic() + duration),
+                                  daemon=True)
+
+        # the sampling thread needs the GIL to take a sample, and by default the loop thread only has to hand it
+        # over every 5ms - short bursts of work would finish first and the samples would all land in select().
+        # a shorter switch interval while profiling keeps the samples honest
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.interval / 10))
+        try:
+            thread.start()
+            await asyncio.sleep(duration)
+        finally:
+            self.running = False
+            sys.setswitchinterval(switch_interval)
+        thread.join()
+        return self.format_report(duration)
+
+    def format_report(self, duration, top=30):
+        report = f"Sampled the event loop thread for {duration} seconds: {self.samples} samples, one every " \
+                 f"{round(self.interval * 1000, 1)} ms\n"
+        for title, counts in (("Self time (running in the function itself)", self.self_counts),
+                              ("Total time (function anywhere on the stack)", self.total_counts)):
+            report += f"\n{title}\n"
+            for (filename, line, function), count in counts.most_common(top):
+                report += f"{round(count / max(self.samples, 1) * 100, 1):>6}%  {count:>6}  {function} " \
+                          f"({filename}:{line})\n"
+        return report
+
+    def _sample(self, thread_id, end):
+        while self.running and time.monotonic() < end:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                self._record(frame)
+            time.sleep(self.interval)
+
+    def _record(self, frame):
+        self.samples += 1
+        self.self_counts[_frame_key(frame)] += 1
+        seen = set()
+        while frame is not None:
+            key = _frame_key(frame)
+            if key not in seen:  # recursive calls only count once per sample
+                seen.add(key)
+                self.total_counts[key] += 1
+            frame = frame.f_back
+
+
+def _frame_key(frame):
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+# logs whatever is blocking the event loop. a heartbeat task on the loop checks in every check_interval, and a
+# watchdog thread logs the loop thread's stack if it hasn't checked in for threshold seconds - i.e. a callback
+# or coroutine step is hogging the loop. asyncio's debug mode does something similar, but slows down every
+# callback to do it
+class LoopWatchdog():
+    def __init__(self, threshold=0.5, check_interval=0.1):
+        self.threshold = threshold
+        self.check_interval = check_interval
+        self.last_beat = time.monotonic()
+        self.loop_thread_id = None
+        self.stalls = 0
+        self.heartbeat_task = None
+        self.running = False
+
+    def start(self, loop):
+        self.running = True
+        self.heartbeat_task = loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+            self.heartbeat_task = None
+
+    async def _heartbeat(self):
+        self.loop_thread_id = threading.get_ident()
+        while True:
+            self.last_beat = time.monotonic()
+            await asyncio.sleep(self.check_interval)
+
+    def _watch(self):
+        stalled_since = None
+        while self.running:
+            time.sleep(self.check_interval)
+            blocked_for = time.monotonic() - self.last_beat
+            if blocked_for < self.threshold + self.check_interval:
+                if stalled_since is not None:
+                    logger.warning(f"Event loop unblocked after {round(time.monotonic() - stalled_since, 2)} seconds.")
+                    stalled_since = None
+                continue
+
+            # only report each stall once, with the stack from when it was first noticed
+            if stalled_since is None and self.loop_thread_id is not None:
+                stalled_since = self.last_beat
+                self.stalls += 1
+                frame = sys._current_frames().get(self.loop_thread_id)
+                stack = "".join(traceback.format_stack(frame)) if frame is not None else "(no stack)\n"
+                logger.warning(f"Event loop blocked for over {self.threshold} seconds. Running:\n{stack}")
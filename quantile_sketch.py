@@ -0,0 +1,117 @@
+import math
+
+
+# streaming quantile estimates with bounded memory (a merging t-digest)
+# values are buffered and periodically compressed into at most ~compression centroids, with smaller centroids
+# near the tails so the medians/p90s we report stay accurate. sketches can be merged, so per-session sketches
+# can be combined into all-time ones without keeping any per-match values around
+class QuantileSketch():
+    def __init__(self, compression=50):
+        self.compression = compression
+        self.centroids = []  # [mean, weight] pairs sorted by mean
+        self.buffer = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value, weight=1):
+        self.buffer.append([value, weight])
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.buffer) >= self.compression * 5:
+            self._compress()
+
+    def merge(self, other):
+        other._compress()
+        self.buffer.extend([mean, weight] for mean, weight in other.centroids)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    def quantile(self, q):
+        self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+
+        # each centroid's mean sits at the middle of its weight. interpolate between neighbouring midpoints,
+        # and between the exact min/max and the first/last midpoints at the edges
+        target = q * self.count
+        cumulative = 0
+        prev_mid, prev_mean = 0, self.min
+        for mean, weight in self.centroids:
+            mid = cumulative + weight / 2
+            if target < mid:
+                return self._interpolate(target, prev_mid, prev_mean, mid, mean)
+            cumulative += weight
+            prev_mid, prev_mean = mid, mean
+
+        return self._interpolate(target, prev_mid, prev_mean, self.count, self.max)
+
+    def to_dict(self):
+        self._compress()
+        return {
+            "compression": self.compression,
+            "centroids": self.centroids,
+            "count": self.count,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["compression"])
+        sketch.centroids = [list(centroid) for centroid in data["centroids"]]
+        sketch.count = data["count"]
+        if data["count"]:
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        return sketch
+
+    def _interpolate(self, target, left_pos, left_value, right_pos, right_value):
+        if right_pos == left_pos:
+            return right_value
+        return left_value + (right_value - left_value) * (target - left_pos) / (right_pos - left_pos)
+
+    # k1 scale function from the t-digest paper - limits how much weight a centroid can hold based on where it
+    # sits in the distribution
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k):
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    # the furthest a centroid starting at q can reach. k only goes up to _k(1), past that the sine wraps back
+    # around and would shrink the limit again, so the last centroid is allowed to run to the end
+    def _next_q_limit(self, q):
+        k = self._k(q) + 1
+        if k >= self._k(1):
+            return 1
+        return self._k_inverse(k)
+
+    def _compress(self):
+        if not self.buffer:
+            return
+
+        items = sorted(self.centroids + self.buffer, key=lambda centroid: centroid[0])
+        self.buffer = []
+
+        total = self.count
+        merged = [list(items[0])]
+        weight_so_far = 0
+        q_limit = self._next_q_limit(0)
+        for mean, weight in items[1:]:
+            current = merged[-1]
+            if (weight_so_far + current[1] + weight) / total <= q_limit:
+                # weighted running mean
+                current[0] += (mean - current[0]) * weight / (current[1] + weight)
+                current[1] += weight
+            else:
+                weight_so_far += current[1]
+                q_limit = self._next_q_limit(min(1, weight_so_far / total))
+                merged.append([mean, weight])
+
+        self.centroids = merged
@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+RECORDING_FILE = "responses.jsonl.gz"
+MATCHES_URL = re.compile(r"gamer/(?P<gamertag>[^/]+)/matches/wz/start/0/end/(?P<end>\d+)/details")
+MATCH_DETAILS_URL = re.compile(r"fullMatch/wz/(?P<match_id>[^/]+)/en")
+REPLAY_GUILD_ID = 1
+
+
+# saves every successful Warzone API response so a real session can be replayed offline later.
+# enabled in the bot with RECORD_API_DIR
+class ApiRecorder():
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, RECORDING_FILE)
+
+    def record(self, req_url, raw):
+        with gzip.open(self.path, "at") as f:
+            f.write(json.dumps({"time": time.time(), "url": req_url, "body": raw.decode()}) + "\n")
+
+
+def load_recording(directory):
+    with gzip.open(os.path.join(directory, RECORDING_FILE), "rt") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# stand-in for the Warzone API. each gamertag's recent matches responses are served in the order they were
+# recorded (one per poll, repeating the last one once they run out), and match details are looked up by ID
+class FakeWarzoneServer():
+    def __init__(self, match_lists, match_details):
+        self.match_lists = match_lists  # gamertag -> [recent matches response body, ...]
+        self.match_details = match_details  # match ID -> fullMatch response body
+        self.positions = {}
+        self.requests = 0
+        self.runner = None
+
+    @classmethod
+    def from_recording(cls, responses):
+        match_lists = {}
+        match_details = {}
+        for response in responses:
+            matches_url = MATCHES_URL.search(response["url"])
+            if matches_url is not None and matches_url.group("end") == "0":
+                match_lists.setdefault(matches_url.group("gamertag"), []).append(response["body"])
+                continue
+
+            details_url = MATCH_DETAILS_URL.search(response["url"])
+            if details_url is not None:
+                match_details[details_url.group("match_id")] = response["body"]
+
+        return cls(match_lists, match_details)
+
+    def get_num_polls(self):
+        return max((len(bodies) for bodies in self.match_lists.values()), default=0)
+
+    # returns the base URL to point WarzoneApi at
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_get("/cod/login", self._login)
+        app.router.add_get("/api/papi-client/{path:.*}", self._api)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        return f"http://{host}:{self.runner.addresses[0][1]}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def _login(self, request):
+        response = web.Response(text="")
+        response.set_cookie("XSRF-TOKEN", "replay")
+        return response
+
+    async def _api(self, request):
+        self.requests += 1
+        path = request.match_info["path"]
+
+        matches_url = MATCHES_URL.search(path)
+        if matches_url is not None:
+            bodies = self.match_lists.get(matches_url.group("gamertag"))
+            if not bodies:
+                return web.Response(text='{"status":"error","data":{"message":"Not permitted: user not found"}}')
+
+            # paging back through history (gap filling, backfill) only ever sees the latest response
+            if matches_url.group("end") != "0":
+                return web.Response(text=self._page_before(bodies[-1], int(matches_url.group("end"))),
+                                    content_type="application/json")
+
+            position = self.positions.get(matches_url.group("gamertag"), 0)
+            self.positions[matches_url.group("gamertag")] = position + 1
+            return web.Response(text=bodies[min(position, len(bodies) - 1)], content_type="application/json")
+
+        details_url = MATCH_DETAILS_URL.search(path)
+        if details_url is not None and details_url.group("match_id") in self.match_details:
+            return web.Response(text=self.match_details[details_url.group("match_id")],
+                                content_type="application/json")
+
+        return web.Response(status=404, text="not found")
+
+    def _page_before(self, body, end):
+        data = json.loads(body)
+        data["data"]["matches"] = [match for match in data["data"]["matches"]
+                                   if match["utcStartSeconds"] * 1000 < end]
+        return json.dumps(data)
+
+
+# runs the bot's real tracker (WarzoneApi -> pipeline -> aggregate) against a FakeWarzoneServer as fast as it
+# will go, with every poll back to back. everything the bot stores is written to a temporary directory.
+# returns the bot's final stats plus per-poll timings
+async def replay(server, accounts=None):
+    # imported here since lumber_bot imports ApiRecorder from this module
+    from lumber_bot import LumberBot
+    from tracker_pipeline import TrackerPipeline
+
+    accounts = accounts or sorted(server.match_lists)
+    base_url = await server.start()
+    messages = []  # the notifications the tracker would have sent
+
+    environ = dict(os.environ)
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ.update({
+            "COD_USERNAMES": ",".join(accounts),
+            "atkn": os.getenv("atkn", "replay"),
+            "ACT_SSO_COOKIE": os.getenv("ACT_SSO_COOKIE", "replay"),
+            "MATCH_CACHE_PATH": os.path.join(data_dir, "match_cache.db"),
+            "HISTORY_DB_PATH": os.path.join(data_dir, "history.db"),
+            "SESSION_STORE_DIR": os.path.join(data_dir, "session_data"),
+            "SEEN_MATCHES_PATH": os.path.join(data_dir, "seen_matches.json"),
+            "SALUTE_DIRECTORY": data_dir,
+            "SALUTE_URL_CACHE": os.path.join(data_dir, "salute_urls.json"),
+            "WZ_COOKIE_PATH": os.path.join(data_dir, "wz_cookies.pickle"),
+            "WZ_API_HOURLY_BUDGET": "1000000000"
+        })
+        os.environ.pop("RECORD_API_DIR", None)
+
+        bot = LumberBot(command_prefix="!", debug=True)
+        bot.api.base_url = base_url + "/api/papi-client/"
+        bot.api.login_url = base_url + "/cod/login"
+        bot.match_cache.matches_ttl = 0  # polls are back to back, so a cached matches list would always be stale
+
+        # a single made up guild whose session follows every account. every match counts, however old the
+        # recording is
+        session = bot.create_session(REPLAY_GUILD_ID)
+        session.apply_event({"type": "start", "time": 0, "continue": False, "accounts": accounts,
+                             "history_session_id": bot.history.start_session(time.time(), REPLAY_GUILD_ID)})
+
+        def notify(notifications):
+            messages.extend(content for _, content, _ in notifications)
+
+        bot.pipeline = TrackerPipeline(bot.api, bot.aggregate_match, notify)
+        bot.pipeline.start()
+
+        poll_times = []
+        start = time.perf_counter()
+        try:
+            for _ in range(server.get_num_polls()):
+                for account in accounts:
+                    poll_start = time.perf_counter()
+                    await bot.track_account(account)
+                    await bot.pipeline.join()
+                    poll_times.append(time.perf_counter() - poll_start)
+            elapsed = time.perf_counter() - start
+        finally:
+            bot.pipeline.stop()
+            bot.dispatcher.close()
+            await bot.api.close()
+            bot.match_cache.close()
+            session.close()
+            bot.history.close()
+            await server.stop()
+            os.environ.clear()
+            os.environ.update(environ)
+
+    return {
+        "stat_tracker": session.stat_tracker,
+        "messages": messages,
+        "poll_times": poll_times,
+        "elapsed": elapsed,
+        "matches": session.stat_tracker.get_num_matches(),
+        "requests": server.requests
+    }
+
+
+async def main(directory):
+    result = await replay(FakeWarzoneServer.from_recording(load_recording(directory)))
+    for message in result["messages"]:
+        print(message + "\n")
+
+    print(result["stat_tracker"].format_session_stats())
+    print(f"Replayed {len(result['poll_times'])} polls ({result['matches']} matches, {result['requests']} API "
+          f"requests) in {round(result['elapsed'], 3)} seconds.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Replay a recorded Warzone session through the tracker")
+    parser.add_argument("directory", help="RECORD_API_DIR the session was recorded to")
+    args = parser.parse_args()
+    asyncio.run(main(args.directory))
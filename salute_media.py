@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import random
+import time
+from discord import File
+
+from json_file import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UPLOAD_LIMIT = 8 * 1024 * 1024  # Discord's upload limit for unboosted guilds and DMs
+
+
+# index of the salute GIFs, built once and refreshed only when the directory changes.
+# after a salute is uploaded the first time, its CDN URL is cached (and saved to disk) so later sends just post
+# the link instead of re-uploading several MB. Discord CDN links are signed and expire, so cached URLs are only
+# reused for url_ttl seconds before the file is uploaded again
+class SaluteMedia():
+    def __init__(self, directory, url_cache_path="salute_urls.json", rescan_interval=60, url_ttl=12 * 60 * 60):
+        self.directory = directory
+        self.url_cache_path = url_cache_path
+        self.rescan_interval = rescan_interval
+        self.url_ttl = url_ttl
+
+        self.files = {}  # filename -> (size, mtime)
+        self.directory_mtime = None
+        self.last_checked = 0
+        self._index()
+
+        # filename -> {"url", "size", "mtime", "uploaded_at"}
+        self.urls = {}
+        if os.path.exists(url_cache_path):
+            with open(url_cache_path) as f:
+                self.urls = json.load(f)
+
+    # pick a random salute that fits within max_size bytes. returns None if none fit
+    def pick(self, max_size=None):
+        self._refresh_if_changed()
+        candidates = [name for name, (size, _) in self.files.items() if max_size is None or size <= max_size]
+        return random.choice(candidates) if candidates else None
+
+    # send content with a random salute attached, reusing a previous upload's URL when possible
+    async def send(self, channel, content):
+        guild = getattr(channel, "guild", None)
+        max_size = guild.filesize_limit if guild is not None else DEFAULT_UPLOAD_LIMIT
+        name = self.pick(max_size)
+        if name is None:
+            logger.info("No salute fits within the upload limit. Sending message without one.")
+            return await channel.send(content)
+
+        url = self._get_cached_url(name)
+        if url is not None and len(content) + len(url) + 1 <= 2000:
+            return await channel.send(f"{content}\n{url}")
+
+        message = await channel.send(content=content, file=File(os.path.join(self.directory, name)))
+        if message.attachments:
+            size, mtime = self.files[name]
+            self.urls[name] = {"url": message.attachments[0].url, "size": size, "mtime": mtime,
+                               "uploaded_at": time.time()}
+            self._save_urls()
+        return message
+
+    def _get_cached_url(self, name):
+        cached = self.urls.get(name)
+        if cached is None:
+            return None
+
+        # the file was replaced since it was uploaded, or the signed link is about to expire
+        if (cached["size"], cached["mtime"]) != self.files[name] or time.time() - cached["uploaded_at"] > self.url_ttl:
+            del self.urls[name]
+            return None
+
+        return cached["url"]
+
+    # a single stat of the directory, at most once every rescan_interval seconds
+    def _refresh_if_changed(self):
+        now = time.time()
+        if now - self.last_checked < self.rescan_interval:
+            return
+
+        self.last_checked = now
+        if os.stat(self.directory).st_mtime != self.directory_mtime:
+            self._index()
+
+    def _index(self):
+        self.directory_mtime = os.stat(self.directory).st_mtime
+        self.last_checked = time.time()
+        self.files = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    self.files[entry.name] = (stat.st_size, stat.st_mtime)
+
+        logger.info(f"Indexed {len(self.files)} salutes in {self.directory}")
+
+    def _save_urls(self):
+        write_json_atomic(self.url_cache_path, self.urls)
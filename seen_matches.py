@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from json_file import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+
+# bounded index of every match the tracker has already handled for each account, persisted across restarts.
+# matches are tracked per account, since a match two tracked accounts played in has to reach the sessions
+# following either of them. entries are kept in the order they were last seen, so eviction drops the least
+# recently seen first - either once there are more than max_entries or once they're older than max_age_days.
+# that is far longer than any match stays in the API's recent matches list, so an evicted match can never
+# come back around as "new".
+# also keeps a watermark per account (start time of the newest match seen), used to spot gaps between polls
+class SeenMatches():
+    def __init__(self, path, max_entries=5000, max_age_days=30):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 24 * 60 * 60
+
+        self.entries = OrderedDict()  # "account/match ID" -> time it was last seen
+        self.watermarks = {}  # account -> utcStartSeconds of the newest match seen for it
+        self.dirty = False
+        self._load()
+
+    def contains(self, account, match_id):
+        return f"{account}/{match_id}" in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, account, match_id, start_time):
+        key = f"{account}/{match_id}"
+        self.entries[key] = time.time()
+        self.entries.move_to_end(key)
+        if start_time > self.watermarks.get(account, 0):
+            self.watermarks[account] = start_time
+        self.dirty = True
+        self.evict()
+
+    def get_watermark(self, account):
+        return self.watermarks.get(account)
+
+    def evict(self):
+        cutoff = time.time() - self.max_age
+        while self.entries:
+            key, seen_at = next(iter(self.entries.items()))
+            if len(self.entries) <= self.max_entries and seen_at >= cutoff:
+                break
+            del self.entries[key]
+            self.dirty = True
+
+    # only writes if something changed since the last save
+    def save(self):
+        if not self.dirty:
+            return
+
+        write_json_atomic(self.path, {"entries": list(self.entries.items()), "watermarks": self.watermarks})
+        self.dirty = False
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except ValueError as e:
+            logger.error(f"Seen match index at {self.path} is unreadable, starting fresh: {e}")
+            return
+
+        self.entries = OrderedDict(data["entries"])
+        self.watermarks = data["watermarks"]
+        self.evict()
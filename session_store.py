@@ -0,0 +1,65 @@
+import json
+import os
+
+from json_file import write_json_atomic
+
+
+# crash-safe storage for the active Warzone session
+# every state change is appended to an event log (one compact JSON object per line, fsynced), and every
+# snapshot_every events the full session state is written to a snapshot along with the log offset it covers.
+# restoring loads the snapshot and replays only the events after that offset, so it stays fast no matter
+# how long the log gets
+class SessionStore():
+    def __init__(self, directory, snapshot_every=25):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.log_path = os.path.join(directory, "events.log")
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+
+        os.makedirs(directory, exist_ok=True)
+        self.log = open(self.log_path, "ab")
+        self.events_since_snapshot = 0
+
+    def append(self, event):
+        self.log.write(json.dumps(event, separators=(",", ":")).encode() + b"\n")
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.events_since_snapshot += 1
+
+    def should_snapshot(self):
+        return self.events_since_snapshot >= self.snapshot_every
+
+    # state has to cover every event appended so far
+    def write_snapshot(self, state):
+        snapshot = {"offset": self.log.tell(), "state": state}
+        write_json_atomic(self.snapshot_path, snapshot, fsync=True, separators=(",", ":"))
+        self.events_since_snapshot = 0
+
+    # returns (latest snapshot state or None, list of events logged after it)
+    def restore(self):
+        state = None
+        offset = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            state = snapshot["state"]
+            offset = snapshot["offset"]
+
+        events = []
+        with open(self.log_path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # partially written last line from a crash - everything before it is still good.
+                    # cut it off so new events aren't appended onto the end of it
+                    self.log.truncate(offset)
+                    break
+                offset += len(line)
+
+        self.events_since_snapshot = len(events)
+        return state, events
+
+    def close(self):
+        self.log.close()
@@ -1,70 +1,153 @@
 import time
-
-
+from array import array
+
+from gamertag_registry import default_registry
+from quantile_sketch import QuantileSketch
+
+# per-match player stats that are stored for every player row, keyed by column name -> playerStats field.
+# adding a new metric here is enough for it to be stored and aggregated (totals, maxima) automatically
+PLAYER_METRICS = {
+    "kills": "kills",
+    "deaths": "deaths",
+    "damage": "damageDone",
+    "headshots": "headshots",
+    "assists": "assists",
+    "damage_taken": "damageTaken"
+}
+
+# per-player distributions tracked with streaming quantile sketches (constant memory per player)
+SKETCH_METRICS = ("kills", "damage", "damage_ratio")
+
+
+# stats are stored column by column in compact typed arrays instead of nested dicts:
+#   - one row per match (team placement)
+#   - one row per player per match (match index, player index, and one column per metric)
+#   - one slot per player for running totals/maxima and quantile sketches, updated as rows come in
+# so the format functions only have to aggregate over a handful of per-player arrays
 class StatTracker():
-    def __init__(self):
+    def __init__(self, names=None):
+        self.names = names if names is not None else default_registry  # gamertag mentions and map names
+        # bumped on every update. rendered replies are cached until it (or the gamertag registry) changes
+        self.version = 0
+        self.render_cache = {}  # (command, args) -> ((version, registry version), rendered reply)
         self.session_start = None
-        self.stats_dict = {
-            "wins": 0,
-            "matches": 0,
-            "team_placements": 0,
-            "players": {}
+        self.wins = 0
+
+        self.match_placements = array("i")
+
+        self.players = []  # player index -> username
+        self.player_index = {}  # username -> player index
+
+        self.row_match = array("i")
+        self.row_player = array("i")
+        self.columns = {metric: array("d") for metric in PLAYER_METRICS}
+
+        self.player_matches = array("i")
+        self.totals = {metric: array("d") for metric in PLAYER_METRICS}
+        self.maxima = {metric: array("d") for metric in PLAYER_METRICS}
+        self.sketches = {metric: [] for metric in SKETCH_METRICS}
+
+    # plain JSON-serializable copy of everything tracked, used for session snapshots
+    def to_snapshot(self):
+        return {
+            "session_start": time.mktime(self.session_start) if self.session_start is not None else None,
+            "wins": self.wins,
+            "match_placements": self.match_placements.tolist(),
+            "players": self.players,
+            "row_match": self.row_match.tolist(),
+            "row_player": self.row_player.tolist(),
+            "columns": {metric: column.tolist() for metric, column in self.columns.items()}
         }
 
+    # rebuilds a tracker from to_snapshot output. per-player totals/maxima/sketches are recomputed from the rows,
+    # so metrics added to PLAYER_METRICS after the snapshot was taken just start out empty
+    @classmethod
+    def from_snapshot(cls, snapshot, names=None):
+        tracker = cls(names)
+        if snapshot["session_start"] is not None:
+            tracker.session_start = time.localtime(snapshot["session_start"])
+        tracker.wins = snapshot["wins"]
+        tracker.match_placements = array("i", snapshot["match_placements"])
+        tracker.row_match = array("i", snapshot["row_match"])
+
+        for username in snapshot["players"]:
+            tracker._add_player(username)
+
+        columns = snapshot["columns"]
+        for row, player_index in enumerate(snapshot["row_player"]):
+            tracker._add_row(player_index, {metric: columns[metric][row] if metric in columns else 0
+                                            for metric in PLAYER_METRICS})
+
+        return tracker
+
     def set_start_time(self, time):
         self.session_start = time
+        self.version += 1
 
     def get_wins(self):
-        return self.stats_dict["wins"]
+        return self.wins
 
     def get_num_matches(self):
-        return self.stats_dict["matches"]
+        return len(self.match_placements)
 
     def get_usernames(self):
-        return self.stats_dict["players"].keys()
+        return list(self.players)
 
     def update_cumulative_match_stats(self, placement):
-        self.stats_dict["matches"] += 1
-        self.stats_dict["team_placements"] += placement
+        self.version += 1
+        self.match_placements.append(placement)
+        if placement == 1:
+            self.wins += 1
 
     def update_cumulative_player_stats(self, username, player_stats):
-        if username not in self.stats_dict["players"]:
-            self.stats_dict["players"][username] = {
-                "kills": 0,
-                "deaths": 0,
-                "damage": 0,
-                "individual_matches": 0,
-                "headshots": 0,
-                "assists": 0,
-                "damage_taken": 0,
-                "max_kills": 0,
-                "max_deaths": 0
-            }
-
-        kills = player_stats["kills"]
-        deaths = player_stats["deaths"]
-
-        self.stats_dict["players"][username]["kills"] += kills
-        self.stats_dict["players"][username]["deaths"] += deaths
-        self.stats_dict["players"][username]["damage"] += player_stats["damageDone"]
-        self.stats_dict["players"][username]["individual_matches"] += 1
-        self.stats_dict["players"][username]["headshots"] += player_stats["headshots"]
-        self.stats_dict["players"][username]["assists"] += player_stats["assists"]
-        self.stats_dict["players"][username]["damage_taken"] += player_stats["damageTaken"]
-
-        if kills > self.stats_dict["players"][username]["max_kills"]:
-            self.stats_dict["players"][username]["max_kills"] = kills
-
-        if deaths > self.stats_dict["players"][username]["max_deaths"]:
-            self.stats_dict["players"][username]["max_deaths"] = deaths
+        self.version += 1
+        index = self.player_index.get(username)
+        if index is None:
+            index = self._add_player(username)
+
+        self.row_match.append(len(self.match_placements) - 1)
+        self._add_row(index, {metric: player_stats[field] for metric, field in PLAYER_METRICS.items()})
+
+    # exported per-player sketches, so they can be merged with other sessions' for all-time views
+    def get_player_sketches(self, username):
+        index = self.player_index.get(username)
+        if index is None:
+            return None
+        return {metric: self.sketches[metric][index] for metric in SKETCH_METRICS}
+
+    def _add_player(self, username):
+        index = len(self.players)
+        self.players.append(username)
+        self.player_index[username] = index
+        self.player_matches.append(0)
+        for metric in PLAYER_METRICS:
+            self.totals[metric].append(0)
+            self.maxima[metric].append(0)
+        for metric in SKETCH_METRICS:
+            self.sketches[metric].append(QuantileSketch())
+
+        return index
+
+    # appends one player row (row_match is handled by the caller) and updates that player's aggregates
+    def _add_row(self, player_index, values):
+        self.row_player.append(player_index)
+        self.player_matches[player_index] += 1
+
+        for metric, value in values.items():
+            self.columns[metric].append(value)
+            self.totals[metric][player_index] += value
+            if value > self.maxima[metric][player_index]:
+                self.maxima[metric][player_index] = value
+
+        self.sketches["kills"][player_index].add(values["kills"])
+        self.sketches["damage"][player_index].add(values["damage"])
+        self.sketches["damage_ratio"][player_index].add(self._calc_ratio(values["damage"], values["damage_taken"]))
 
     def format_win_message(self, match_data, match_stats):
-        self.stats_dict["wins"] += 1
-
         match_start_time = time.strftime("%m/%d %H:%M:%S", time.localtime(match_data["utcStartSeconds"]))
         duration = round((match_data["utcEndSeconds"] - match_data["utcStartSeconds"]) / 60, 2)
         stats = self.format_win_message_stats(match_stats)
-        map_name = self._replace_map_name(match_data["map"])
+        map_name = self.names.get_map_name(match_data["map"])
 
         message = "Congratulations on a recent Warzone win!\n" \
                   f"**Match Start Time**: {match_start_time}\n" \
@@ -83,71 +166,61 @@ class StatTracker():
             kd_ratio = self._calc_ratio(kills, deaths)
             damage = stats["damage"]
 
-            player = self._replace_player_name(player)
+            player = self.names.get_mention(player)
             format += f"    • {player}: {int(kills)}-{int(deaths)} ({kd_ratio} K/D), {int(damage)} damage.\n"
 
         return format
 
-    # formats cumulative session stats from the stats dictionary
+    # formats cumulative session stats. everything but the duration so far is cached
     def format_session_stats(self):
-        team_matches = self.stats_dict["matches"]
-        if team_matches == 0:
+        if self.get_num_matches() == 0:
             return None
 
         current_time = time.localtime()
         full_duration = round((time.mktime(current_time) - time.mktime(self.session_start)) / 60, 2)
+        return self._cached(("session_stats",), self._format_session_summary) + \
+            f"**Total Session Duration**: {full_duration} minutes\n"
 
-        wins = self.stats_dict["wins"]
+    def _format_session_summary(self):
+        team_matches = self.get_num_matches()
+        wins = self.wins
         win_str = "win" if wins == 1 else "wins"
-        avg_placement = int(round(self.stats_dict["team_placements"] / team_matches, 2))
-
-        total_kills = 0
-        total_deaths = 0
-        max_kills = 0
-        max_deaths = 0
-        max_kills_usernames = set()
-        max_deaths_usernames = set()
-        for player, stats in self.stats_dict["players"].items():
-            total_kills += stats["kills"]
-            total_deaths += stats["deaths"]
-            player_max_kills = stats["max_kills"]
-            player_max_deaths = stats["max_deaths"]
-            if player_max_kills > max_kills:
-                max_kills = player_max_kills
-                max_kills_usernames = {player}
-            if player_max_kills == max_kills:
-                max_kills_usernames.add(player)
-            if player_max_deaths > max_deaths:
-                max_deaths = player_max_deaths
-                max_deaths_usernames = {player}
-            if player_max_deaths == max_deaths:
-                max_deaths_usernames.add(player)
+        avg_placement = int(round(sum(self.match_placements) / team_matches, 2))
 
+        total_kills = sum(self.totals["kills"])
+        total_deaths = sum(self.totals["deaths"])
         team_kd = self._calc_ratio(total_kills, total_deaths)
 
-        max_kills_usernames = ', '.join(max_kills_usernames)
-        max_deaths_usernames = ', '.join(max_deaths_usernames)
+        # matches whose details never came through are counted without any player rows
+        max_kills_line = max_deaths_line = "N/A"
+        if self.players:
+            max_kills, max_kills_usernames = self._max_with_ties(self.maxima["kills"])
+            max_deaths, max_deaths_usernames = self._max_with_ties(self.maxima["deaths"])
+            max_kills_line = f"{int(max_kills)} ({', '.join(self.players[i] for i in max_kills_usernames)})"
+            max_deaths_line = f"{int(max_deaths)} ({', '.join(self.players[i] for i in max_deaths_usernames)})"
 
         return f"**Session Start**: {self._format_time(self.session_start)}\n" \
                f"**Matches Played**: {team_matches}\n" \
                f"**Team K/D**: {int(total_kills)}-{int(total_deaths)} ({team_kd})\n" \
                f"**Average Team Placement**: {avg_placement} ({wins} {win_str})\n" \
-               f"**Max Kills**: {int(max_kills)} ({max_kills_usernames})\n" \
-               f"**Max Deaths**: {int(max_deaths)} ({max_deaths_usernames})\n" \
-               f"**Total Session Duration**: {full_duration} minutes\n"
+               f"**Max Kills**: {max_kills_line}\n" \
+               f"**Max Deaths**: {max_deaths_line}\n"
 
-    # formats cumulative individual stats from the stats dictionary
+    # formats cumulative individual stats
     def format_individual_stats(self, username):
-        if self.stats_dict["matches"] == 0 or username not in self.stats_dict["players"]:
+        return self._cached(("player_stats", username), lambda: self._format_individual_stats(username))
+
+    def _format_individual_stats(self, username):
+        index = self.player_index.get(username)
+        if self.get_num_matches() == 0 or index is None:
             return None
 
-        player_stats = self.stats_dict["players"][username]
-        kills = player_stats["kills"]
-        deaths = player_stats["deaths"]
-        damage = player_stats["damage"]
-        matches = player_stats["individual_matches"]
-        max_kills = player_stats["max_kills"]
-        max_deaths = player_stats["max_deaths"]
+        kills = self.totals["kills"][index]
+        deaths = self.totals["deaths"][index]
+        damage = self.totals["damage"][index]
+        matches = self.player_matches[index]
+        max_kills = self.maxima["kills"][index]
+        max_deaths = self.maxima["deaths"][index]
 
         kd_ratio = self._calc_ratio(kills, deaths)
         avg_kills = round(kills / matches, 2)
@@ -159,112 +232,127 @@ class StatTracker():
                f"**K/D**: {int(kills)}-{int(deaths)} ({kd_ratio})\n" \
                f"**Average Kills**: {avg_kills} (Max: {int(max_kills)})\n" \
                f"**Average Deaths**: {avg_deaths} (Max: {int(max_deaths)})\n" \
-               f"**Average Damage**: {avg_damage} ({int(damage)} total)\n"
+               f"**Average Damage**: {avg_damage} ({int(damage)} total)\n" \
+               + self.format_quantile_stats(self.get_player_sketches(username))
+
+    # median/p90 lines for a player's sketches (from this session or merged from history)
+    def format_quantile_stats(self, sketches):
+        kills = sketches["kills"]
+        damage = sketches["damage"]
+        damage_ratio = sketches["damage_ratio"]
+
+        return f"**Median Kills**: {self._round_quantile(kills, 0.5)} (p90: {self._round_quantile(kills, 0.9)})\n" \
+               f"**Median Damage**: {self._round_quantile(damage, 0.5)} (p90: {self._round_quantile(damage, 0.9)})\n" \
+               f"**Median Damage Ratio**: {self._round_quantile(damage_ratio, 0.5)} " \
+               f"(p90: {self._round_quantile(damage_ratio, 0.9)})\n"
+
+    # formats a player's stats over a time window, from StatsHistory.get_player_window. days=None means all time,
+    # which also reports quantiles from the merged session sketches if there are any
+    def format_window_stats(self, username, days, stats, sketches=None):
+        kills = stats["kills"]
+        deaths = stats["deaths"]
+        damage = stats["damage"]
+        matches = stats["matches"]
+
+        window = "all time" if days is None else f"last {days} days"
+        quantile_stats = self.format_quantile_stats(sketches) if sketches is not None else ""
+
+        return f"Stats for **{username}** ({window}):\n" \
+               f"**Matches Played**: {matches}\n" \
+               f"**K/D**: {int(kills)}-{int(deaths)} ({self._calc_ratio(kills, deaths)})\n" \
+               f"**Average Kills**: {round(kills / matches, 2)} (Max: {int(stats['max_kills'])})\n" \
+               f"**Average Deaths**: {round(deaths / matches, 2)} (Max: {int(stats['max_deaths'])})\n" \
+               f"**Average Damage**: {round(damage / matches, 2)} ({int(damage)} total)\n" \
+               + quantile_stats
+
+    # formats a past session's stats, from StatsHistory.get_session
+    def format_past_session_stats(self, session):
+        team_matches = session["matches"]
+        wins = session["wins"]
+        win_str = "win" if wins == 1 else "wins"
+        avg_placement = int(round(session["placements"] / team_matches, 2))
 
-    # processes stats and assigns awards
-    def format_awards(self):
-        if self.stats_dict["matches"] == 0:
-            return None
+        players = list(session["players"])
+        stats = list(session["players"].values())
+        total_kills = sum(player["kills"] for player in stats)
+        total_deaths = sum(player["deaths"] for player in stats)
 
-        # if there is a tie, there will be multiple usernames in the list
-        best_kd = -1
-        best_kd_winners = []
+        max_kills_line = max_deaths_line = "N/A"
+        if players:
+            max_kills, max_kills_usernames = self._max_with_ties([player["max_kills"] for player in stats])
+            max_deaths, max_deaths_usernames = self._max_with_ties([player["max_deaths"] for player in stats])
+            max_kills_line = f"{int(max_kills)} ({', '.join(players[i] for i in max_kills_usernames)})"
+            max_deaths_line = f"{int(max_deaths)} ({', '.join(players[i] for i in max_deaths_usernames)})"
 
-        worst_kd = 10000
-        worst_kd_winners = []
+        end = session["end"] if session["end"] is not None else time.time()
+        full_duration = round((end - session["start"]) / 60, 2)
 
-        most_kills = -1
-        most_kills_winners = []
+        return f"**Session Start**: {self._format_time(time.localtime(session['start']))}\n" \
+               f"**Matches Played**: {team_matches}\n" \
+               f"**Team K/D**: {int(total_kills)}-{int(total_deaths)} ({self._calc_ratio(total_kills, total_deaths)})\n" \
+               f"**Average Team Placement**: {avg_placement} ({wins} {win_str})\n" \
+               f"**Max Kills**: {max_kills_line}\n" \
+               f"**Max Deaths**: {max_deaths_line}\n" \
+               f"**Total Session Duration**: {full_duration} minutes\n"
 
-        most_deaths = -1
-        most_deaths_winners = []
+    # processes stats and assigns awards
+    # if there is a tie, all of the tied players get the award
+    def format_awards(self):
+        return self._cached(("awards",), self._format_awards)
 
-        best_damage_ratio = -1
-        best_damage_winners = []
+    def _format_awards(self):
+        if self.get_num_matches() == 0 or not self.players:
+            return "**Awards**\nNo player stats have been recorded this session."
 
-        for player, stats in self.stats_dict["players"].items():
-            kills = stats["kills"]
-            deaths = stats["deaths"]
-            damage = stats["damage"]
-            damage_taken = stats["damage_taken"]
-            kd_ratio = self._calc_ratio(kills, deaths)
-            damage_ratio = self._calc_ratio(damage, damage_taken)
-
-            player = self._replace_player_name(player)
-
-            # MVP Award (Best KD Ratio)
-            if kd_ratio == best_kd:
-                best_kd_winners.append(player)
-            elif kd_ratio > best_kd:
-                best_kd_winners = [player]  # clear list and replace with new winner
-                best_kd = kd_ratio
-
-            # Carried Award (Worst KD Ratio)
-            if kd_ratio == worst_kd:
-                worst_kd_winners.append(player)
-            elif kd_ratio < worst_kd:
-                worst_kd_winners = [player]
-                worst_kd = kd_ratio
-
-            # Bloodthirsty Award (Most Kills)
-            if kills == most_kills:
-                most_kills_winners.append(player)
-            elif kills > most_kills:
-                most_kills_winners = [player]
-                most_kills = kills
-
-            # Cannon Fodder Award (Most Deaths)
-            if deaths == most_deaths:
-                most_deaths_winners.append(player)
-            elif deaths > most_deaths:
-                most_deaths_winners = [player]
-                most_deaths = deaths
-
-            # Commando Award (Best Damage Ratio)
-            if damage_ratio == best_damage_ratio:
-                best_damage_winners.append(player)
-            elif damage_ratio > best_damage_ratio:
-                best_damage_winners = [player]
-                best_damage_ratio = damage_ratio
+        kd_ratios = list(map(self._calc_ratio, self.totals["kills"], self.totals["deaths"]))
+        damage_ratios = list(map(self._calc_ratio, self.totals["damage"], self.totals["damage_taken"]))
+
+        best_kd, best_kd_winners = self._max_with_ties(kd_ratios)  # MVP Award (Best KD Ratio)
+        worst_kd, worst_kd_winners = self._min_with_ties(kd_ratios)  # Carried Award (Worst KD Ratio)
+        most_kills, most_kills_winners = self._max_with_ties(self.totals["kills"])  # Bloodthirsty Award (Most Kills)
+        most_deaths, most_deaths_winners = self._max_with_ties(self.totals["deaths"])  # Cannon Fodder Award (Most Deaths)
+        best_damage_ratio, best_damage_winners = self._max_with_ties(damage_ratios)  # Commando Award (Best Damage Ratio)
+
+        # distribution-based awards, so one huge game can't win them on its own
+        median_damage = [self._round_quantile(sketch, 0.5) for sketch in self.sketches["damage"]]
+        p90_kills = [self._round_quantile(sketch, 0.9) for sketch in self.sketches["kills"]]
+        best_median_damage, workhorse_winners = self._max_with_ties(median_damage)  # Workhorse Award (Best Median Damage)
+        best_p90_kills, highlight_winners = self._max_with_ties(p90_kills)  # Highlight Reel Award (Best p90 Kills)
 
         return f"**Awards**\n" \
-               f"    •**MVP**: {', '.join(best_kd_winners)} ({best_kd} K/D)\n" \
-               f"    •**Carried**: {', '.join(worst_kd_winners)} ({worst_kd} K/D)\n" \
-               f"    •**Bloodthirsty**: {', '.join(most_kills_winners)} ({int(most_kills)} kills)\n" \
-               f"    •**Cannon Fodder**: {', '.join(most_deaths_winners)} ({int(most_deaths)} deaths)\n" \
-               f"    •**Commando**: {', '.join(best_damage_winners)} ({best_damage_ratio} damage ratio)"
-
-    # hardcode known gamertags to Discord message IDs
-    def _replace_player_name(self, player):
-        if player == "bglowniak":
-            player = "<@250017966928691211>"
-        elif player == "triplexlink":
-            player = "<@273518554517602305>"
-        elif player == "funny_monkey998":
-            player = "<@479298269110075433>"
-        elif player == "MisterDuV":
-            player = "<@425035767350296578>"
-        elif player == "Sharkyplace":
-            player = "<@545430460860334082>"
-        elif player == "TetoTeto":
-            player = "<@483853566281383946>"
-        elif player == "cooliodude13":
-            player = "<@137213864872902656>"
-
-        return player
-
-    # replace map IDs with known map name
-    def _replace_map_name(self, map_name):
-        if map_name.startswith("mp_don"):
-            return "Verdansk"
-        elif map_name.startswith("mp_escape"):
-            return "Rebirth"
-        elif map_name.startswith("mp_wz_island"):
-            return "Caldera"
-        elif map_name.startswith("mp_sm_island"):
-            return "Fortune's Keep"
-        else:
-            return map_name
+               f"    •**MVP**: {self._format_winners(best_kd_winners)} ({best_kd} K/D)\n" \
+               f"    •**Carried**: {self._format_winners(worst_kd_winners)} ({worst_kd} K/D)\n" \
+               f"    •**Bloodthirsty**: {self._format_winners(most_kills_winners)} ({int(most_kills)} kills)\n" \
+               f"    •**Cannon Fodder**: {self._format_winners(most_deaths_winners)} ({int(most_deaths)} deaths)\n" \
+               f"    •**Commando**: {self._format_winners(best_damage_winners)} ({best_damage_ratio} damage ratio)\n" \
+               f"    •**Workhorse**: {self._format_winners(workhorse_winners)} ({best_median_damage} median damage)\n" \
+               f"    •**Highlight Reel**: {self._format_winners(highlight_winners)} ({best_p90_kills} p90 kills)"
+
+    def _cached(self, key, render):
+        version = (self.version, self.names.get_version())
+        cached = self.render_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        rendered = render()
+        self.render_cache[key] = (version, rendered)
+        return rendered
+
+    # returns the max value of a per-player column and the indices of every player that has it
+    def _max_with_ties(self, values):
+        best = max(values)
+        return best, [i for i, value in enumerate(values) if value == best]
+
+    def _min_with_ties(self, values):
+        worst = min(values)
+        return worst, [i for i, value in enumerate(values) if value == worst]
+
+    def _format_winners(self, player_indices):
+        return ', '.join(self.names.get_mention(self.players[i]) for i in player_indices)
+
+    def _round_quantile(self, sketch, q):
+        value = sketch.quantile(q)
+        return None if value is None else round(value, 2)
 
     def _format_time(self, time_input):
         if time_input is None:
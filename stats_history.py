@@ -0,0 +1,207 @@
+import json
+import re
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from quantile_sketch import QuantileSketch
+from stat_tracker import PLAYER_METRICS
+
+# rollup periods. day and week rollups are keyed by the local date the bucket starts on, session rollups by session ID
+DAY = "day"
+WEEK = "week"
+SESSION = "session"
+
+# windows longer than this are answered from weekly rollups (rounded to whole weeks) instead of daily ones
+MAX_DAILY_WINDOW_DAYS = 90
+
+
+# every processed match is stored here permanently, along with per-player and per-team rollups by day, week and
+# session that are updated as each match is recorded. queries only ever sum a handful of rollup rows
+# (at most ~90 daily or ~52 weekly rows per player for a year), so they stay fast no matter how much history there is
+class StatsHistory():
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+
+        metric_columns = ", ".join(f"{metric} REAL" for metric in PLAYER_METRICS)
+        self.db.execute("CREATE TABLE IF NOT EXISTS sessions (session_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                        "start REAL, end REAL, guild_id INTEGER)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS matches (match_id TEXT PRIMARY KEY, session_id INTEGER, "
+                        "start_time REAL, end_time REAL, placement INTEGER)")
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS player_matches (match_id TEXT, username TEXT, {metric_columns}, "
+                        "PRIMARY KEY (match_id, username))")
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS player_rollups (period TEXT, bucket TEXT, username TEXT, "
+                        f"matches INTEGER, {metric_columns}, max_kills REAL, max_deaths REAL, "
+                        "PRIMARY KEY (period, username, bucket))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS team_rollups (period TEXT, bucket TEXT, matches INTEGER, "
+                        "wins INTEGER, placements INTEGER, PRIMARY KEY (period, bucket))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS player_sketches (session_id INTEGER, username TEXT, metric TEXT, "
+                        "sketch TEXT, PRIMARY KEY (username, metric, session_id))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS player_rollups_bucket ON player_rollups (period, bucket)")
+
+        # a match can count towards several guilds' sessions, but only once towards each
+        self.db.execute("CREATE TABLE IF NOT EXISTS session_matches (session_id INTEGER, match_id TEXT, "
+                        "PRIMARY KEY (session_id, match_id))")
+        self.db.commit()
+
+        metric_names = ", ".join(PLAYER_METRICS)
+        metric_params = ", ".join("?" for _ in PLAYER_METRICS)
+        metric_updates = ", ".join(f"{metric} = {metric} + excluded.{metric}" for metric in PLAYER_METRICS)
+        self.player_match_sql = f"INSERT INTO player_matches (match_id, username, {metric_names}) " \
+                                f"VALUES (?, ?, {metric_params})"
+        self.player_rollup_sql = f"INSERT INTO player_rollups (period, bucket, username, matches, {metric_names}, " \
+                                 f"max_kills, max_deaths) VALUES (?, ?, ?, 1, {metric_params}, ?, ?) " \
+                                 f"ON CONFLICT (period, username, bucket) DO UPDATE SET matches = matches + 1, " \
+                                 f"{metric_updates}, max_kills = MAX(max_kills, excluded.max_kills), " \
+                                 f"max_deaths = MAX(max_deaths, excluded.max_deaths)"
+        self.team_rollup_sql = "INSERT INTO team_rollups VALUES (?, ?, 1, ?, ?) ON CONFLICT (period, bucket) DO UPDATE " \
+                               "SET matches = matches + 1, wins = wins + excluded.wins, " \
+                               "placements = placements + excluded.placements"
+
+    def start_session(self, start_time, guild_id=None):
+        cursor = self.db.execute("INSERT INTO sessions (start, guild_id) VALUES (?, ?)", (start_time, guild_id))
+        self.db.commit()
+        return cursor.lastrowid
+
+    def end_session(self, session_id, end_time):
+        self.db.execute("UPDATE sessions SET end = ? WHERE session_id = ?", (end_time, session_id))
+        self.db.commit()
+
+    # records a match and folds it into every rollup it belongs to. recording the same match twice is a no-op,
+    # except that it is added to each session it's recorded for (once)
+    # player_stats is {username: {playerStats field: value}} for the tracked team
+    def record_match(self, match_id, session_id, start_time, end_time, placement, player_stats):
+        cursor = self.db.execute("INSERT OR IGNORE INTO matches VALUES (?, ?, ?, ?, ?)",
+                                 (match_id, session_id, start_time, end_time, placement))
+        new_match = cursor.rowcount == 1
+
+        buckets = []
+        if new_match:
+            buckets = [(DAY, self._day_bucket(start_time)), (WEEK, self._week_bucket(start_time))]
+        if session_id is not None:
+            cursor = self.db.execute("INSERT OR IGNORE INTO session_matches VALUES (?, ?)", (session_id, match_id))
+            if cursor.rowcount == 1:
+                buckets.append((SESSION, str(session_id)))
+        if not buckets:
+            return
+
+        win = 1 if placement == 1 else 0
+        self.db.executemany(self.team_rollup_sql, [(period, bucket, win, placement) for period, bucket in buckets])
+
+        for username, stats in player_stats.items():
+            values = [stats[field] for field in PLAYER_METRICS.values()]
+            if new_match:
+                self.db.execute(self.player_match_sql, [match_id, username] + values)
+            self.db.executemany(self.player_rollup_sql,
+                                [[period, bucket, username] + values + [stats["kills"], stats["deaths"]]
+                                 for period, bucket in buckets])
+
+        self.db.commit()
+
+    # stores a session's per-player quantile sketches ({username: {metric: QuantileSketch}}), replacing any
+    # saved earlier for the same session (e.g. when a continued session ends again)
+    def save_session_sketches(self, session_id, player_sketches):
+        self.db.executemany("INSERT OR REPLACE INTO player_sketches VALUES (?, ?, ?, ?)",
+                            [(session_id, username, metric, json.dumps(sketch.to_dict(), separators=(",", ":")))
+                             for username, sketches in player_sketches.items()
+                             for metric, sketch in sketches.items()])
+        self.db.commit()
+
+    # merges every saved session sketch for a player into all-time sketches. returns None if there are none
+    def get_all_time_sketches(self, username):
+        merged = {}
+        for metric, data in self.db.execute("SELECT metric, sketch FROM player_sketches WHERE username = ?",
+                                            (username,)):
+            sketch = QuantileSketch.from_dict(json.loads(data))
+            if metric in merged:
+                merged[metric].merge(sketch)
+            else:
+                merged[metric] = sketch
+
+        return merged or None
+
+    # returns summed stats for a player over the last `days` days (or all time if days is None), or None if they have no matches in that window
+    def get_player_window(self, username, days, now=None):
+        period, cutoff = self._window_start(days, now)
+        row = self.db.execute(f"SELECT SUM(matches), {', '.join(f'SUM({metric})' for metric in PLAYER_METRICS)}, "
+                              "MAX(max_kills), MAX(max_deaths) FROM player_rollups "
+                              "WHERE period = ? AND username = ? AND bucket >= ?",
+                              (period, username, cutoff)).fetchone()
+        if not row[0]:
+            return None
+
+        return self._player_row_to_dict(row)
+
+    def get_last_session_id(self, guild_id=None):
+        # sessions where no matches were played are skipped, so they don't hide the last one that had some
+        sql = "SELECT MAX(session_id) FROM sessions WHERE end IS NOT NULL " \
+              "AND EXISTS (SELECT 1 FROM session_matches WHERE session_matches.session_id = sessions.session_id)"
+        if guild_id is None:
+            row = self.db.execute(sql).fetchone()
+        else:
+            row = self.db.execute(sql + " AND guild_id = ?", (guild_id,)).fetchone()
+        return row[0]
+
+    # returns team totals and per-player stats for a recorded session, or None if no matches were recorded for it
+    def get_session(self, session_id):
+        bucket = str(session_id)
+        session_row = self.db.execute("SELECT start, end FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        team_row = self.db.execute("SELECT matches, wins, placements FROM team_rollups WHERE period = ? AND bucket = ?",
+                                   (SESSION, bucket)).fetchone()
+        if session_row is None or team_row is None:
+            return None
+
+        players = {}
+        for row in self.db.execute(f"SELECT username, matches, {', '.join(PLAYER_METRICS)}, max_kills, max_deaths "
+                                   "FROM player_rollups WHERE period = ? AND bucket = ?", (SESSION, bucket)):
+            players[row[0]] = self._player_row_to_dict(row[1:])
+
+        return {
+            "start": session_row[0],
+            "end": session_row[1],
+            "matches": team_row[0],
+            "wins": team_row[1],
+            "placements": team_row[2],
+            "players": players
+        }
+
+    def close(self):
+        self.db.close()
+
+    def _player_row_to_dict(self, row):
+        stats = {"matches": row[0]}
+        for i, metric in enumerate(PLAYER_METRICS):
+            stats[metric] = row[i + 1]
+        stats["max_kills"] = row[-2]
+        stats["max_deaths"] = row[-1]
+        return stats
+
+    def _window_start(self, days, now=None):
+        if days is None:
+            return WEEK, ""
+
+        today = date.fromtimestamp(time.time() if now is None else now)
+        start = today - timedelta(days=days - 1)
+        if days <= MAX_DAILY_WINDOW_DAYS:
+            return DAY, start.isoformat()
+        return WEEK, (start - timedelta(days=start.weekday())).isoformat()
+
+    def _day_bucket(self, timestamp):
+        return date.fromtimestamp(timestamp).isoformat()
+
+    # weeks start on Monday
+    def _week_bucket(self, timestamp):
+        day = date.fromtimestamp(timestamp)
+        return (day - timedelta(days=day.weekday())).isoformat()
+
+
+# parses window arguments like "30d" or "4w" into a number of days. returns None if the argument isn't a window
+# ("all" is handled separately by the caller)
+def parse_window(window_arg):
+    match = re.fullmatch(r"(\d+)([dw])", window_arg.strip().lower())
+    if match is None:
+        return None
+
+    amount = int(match.group(1))
+    return amount * 7 if match.group(2) == "w" else amount
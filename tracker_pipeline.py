@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import time
+
+from match_parser import parse_team_rows
+
+logger = logging.getLogger(__name__)
+
+
+# one unit of work flowing through the pipeline. jobs without a match are cursor markers - they pass straight
+# through fetch/parse so the aggregate stage can record an account's cursor only after every match before it
+class MatchJob():
+    __slots__ = ("seq", "account", "match", "cursor", "raw_details", "team_stats", "error")
+
+    def __init__(self, seq, account, match=None, cursor=None):
+        self.seq = seq
+        self.account = account
+        self.match = match
+        self.cursor = cursor
+        self.raw_details = None
+        self.team_stats = None  # {username: {playerStats field: value}} for the tracked account's team
+        self.error = None
+
+
+class Stage():
+    def __init__(self, name, handler, workers, queue_size):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.tasks = []
+
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+
+    def get_stats(self):
+        avg_time = self.busy_time / self.processed if self.processed else 0
+        return {
+            "processed": self.processed,
+            "errors": self.errors,
+            "queue_depth": self.queue.qsize(),
+            "avg_ms": round(avg_time * 1000, 2)
+        }
+
+
+# the win tracker as a streaming pipeline: fetch -> parse -> aggregate -> notify
+# stages are connected by bounded queues, so a slow stage applies backpressure to the ones before it instead of
+# buffering without limit, and match details can be fetched while earlier matches are still being aggregated and
+# announced. aggregate runs on a single worker and puts jobs back in submission order, so stats and win counts
+# are always applied chronologically
+class TrackerPipeline():
+    def __init__(self, api, aggregate_fn, notify_fn, fetch_concurrency=4, queue_size=16):
+        self.api = api
+        self.aggregate_fn = aggregate_fn  # aggregate_fn(job) -> list of (guild ID, content, salute) notifications
+        self.notify_fn = notify_fn  # notify_fn(notifications)
+
+        self.stages = [
+            Stage("fetch", self._fetch, fetch_concurrency, queue_size),
+            Stage("parse", self._parse, 1, queue_size),
+            Stage("aggregate", self._aggregate, 1, queue_size),
+            Stage("notify", self._notify, 1, queue_size)
+        ]
+        self.next_seq = 0
+        self.next_aggregate_seq = 0
+        self.out_of_order = {}  # seq -> job that finished fetching before an earlier one
+
+    def start(self):
+        for i, stage in enumerate(self.stages):
+            next_stage = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            stage.tasks = [asyncio.get_event_loop().create_task(self._run(stage, next_stage))
+                           for _ in range(stage.workers)]
+
+    def stop(self):
+        for stage in self.stages:
+            for task in stage.tasks:
+                task.cancel()
+            stage.tasks = []
+
+    # waits for room in the fetch queue, which is how a backed up pipeline slows down polling
+    async def submit(self, account, match):
+        await self.stages[0].queue.put(MatchJob(self._take_seq(), account, match=match))
+
+    # cursor is opaque to the pipeline - it is handed to aggregate_fn once every job before it is aggregated
+    async def submit_cursor(self, account, cursor):
+        await self.stages[0].queue.put(MatchJob(self._take_seq(), account, cursor=cursor))
+
+    # waits until everything submitted so far has made it all the way through the pipeline
+    async def join(self):
+        for stage in self.stages:
+            await stage.queue.join()
+
+    def get_stats(self):
+        return {stage.name: stage.get_stats() for stage in self.stages}
+
+    def _take_seq(self):
+        seq = self.next_seq
+        self.next_seq += 1
+        return seq
+
+    async def _run(self, stage, next_stage):
+        while True:
+            job = await stage.queue.get()
+            start = time.perf_counter()
+            try:
+                results = await stage.handler(job)
+            except Exception as e:
+                logger.exception(f"Tracker pipeline {stage.name} stage failed: {e}")
+                stage.errors += 1
+                # every job has to reach aggregate, otherwise the jobs queued after it would wait there forever
+                if isinstance(job, MatchJob):
+                    job.error = e
+                    job.raw_details = None
+                    results = [job]
+                else:
+                    results = []
+            stage.busy_time += time.perf_counter() - start
+            stage.processed += 1
+
+            if next_stage is not None:
+                for result in results:
+                    await next_stage.queue.put(result)
+            stage.queue.task_done()
+
+    async def _fetch(self, job):
+        if job.match is not None:
+            # no API auth or response checks here - if we don't get the expected data, the match is still
+            # counted but no player stats are recorded for it
+            try:
+                job.raw_details = await self.api.get_match_details_raw(job.match["matchID"])
+            except Exception as e:
+                logging.error(f"Match Details call failed: {e}")
+                job.error = e
+        return [job]
+
+    # only the tracked account's team is decoded into records - see match_parser.parse_team_rows
+    async def _parse(self, job):
+        if job.raw_details is not None:
+            rows = parse_team_rows(job.raw_details, job.match["player"]["team"])
+            job.team_stats = {row.username: row.to_player_stats() for row in rows}
+            job.raw_details = None  # done with the full lobby
+        return [job]
+
+    async def _aggregate(self, job):
+        self.out_of_order[job.seq] = job
+        notifications = []
+        while self.next_aggregate_seq in self.out_of_order:
+            ready = self.out_of_order.pop(self.next_aggregate_seq)
+            self.next_aggregate_seq += 1
+            try:
+                notifications.extend(self.aggregate_fn(ready))
+            except Exception as e:
+                logger.exception(f"Tracker pipeline failed to aggregate job {ready.seq}: {e}")
+                self.stages[2].errors += 1
+
+        return [notifications] if notifications else []
+
+    async def _notify(self, notifications):
+        self.notify_fn(notifications)
+        return []
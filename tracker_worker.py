@@ -0,0 +1,180 @@
+import asyncio
+import inspect
+import logging
+import multiprocessing
+import os
+import queue
+
+from metrics import start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+# commands that read or change session state. in worker mode these run in the worker process, everything else
+# (triggers, link/unlink, metrics, profile, clear_channel) stays in the gateway
+WORKER_COMMANDS = ("start_wz", "end_wz", "backfill", "tracker_status", "session_stats", "player_stats", "awards")
+
+
+# gateway side of the worker mode. the worker is a separate process running its own LumberBot without a Discord
+# connection: it owns the sessions, the Warzone API client, parsing and the stat trackers, so none of that work
+# shares an event loop (or the GIL) with the gateway's heartbeats and command replies.
+# the two talk over a pair of multiprocessing queues:
+#   gateway -> worker: {"type": "guilds"}, {"type": "command"}, {"type": "stop"}
+#   worker -> gateway: {"type": "notify"} (tracker notifications as (guild ID, content, salute)) and
+#                      {"type": "send"} (a command's reply to a channel)
+class WorkerProcess():
+    def __init__(self, debug):
+        self.debug = debug
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.to_worker = None
+        self.from_worker = None
+        self.restarts = 0
+
+    def start(self):
+        self.to_worker = self.context.Queue()
+        self.from_worker = self.context.Queue()
+        self.process = self.context.Process(target=run_worker, args=(self.to_worker, self.from_worker, self.debug),
+                                            name="tracker-worker", daemon=True)
+        self.process.start()
+        logging.info(f"Started tracker worker process {self.process.pid}.")
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def send_guilds(self, guilds):
+        self.to_worker.put({"type": "guilds", "guilds": [(guild.id, guild.name) for guild in guilds]})
+
+    def run_command(self, ctx):
+        # everything after the command name, split the same way the commands' own arguments are
+        args = ctx.view.read_rest().split()
+        self.to_worker.put({"type": "command", "name": ctx.command.name, "args": args, "guild_id": ctx.guild.id,
+                            "guild_name": ctx.guild.name, "channel_id": ctx.channel.id})
+
+    # calls handler with every message from the worker until it exits
+    async def receive(self, handler):
+        loop = asyncio.get_event_loop()
+        while True:
+            message = await loop.run_in_executor(None, self._get)
+            if message is None:
+                return
+            try:
+                await handler(message)
+            except Exception as e:
+                logger.exception(f"Failed to handle {message['type']} message from the tracker worker: {e}")
+
+    def stop(self, timeout=10):
+        if self.process is None:
+            return
+
+        self.to_worker.put({"type": "stop"})
+        self.process.join(timeout)
+        if self.process.is_alive():
+            logger.error("Tracker worker didn't stop in time. Terminating it.")
+            self.process.terminate()
+            self.process.join()
+        self.process = None
+
+    def _get(self):
+        while True:
+            try:
+                return self.from_worker.get(timeout=1)
+            except queue.Empty:
+                if not self.is_alive():
+                    return None
+
+
+# worker side of the queues
+class GatewayLink():
+    def __init__(self, to_worker, from_worker):
+        self.to_worker = to_worker
+        self.from_worker = from_worker
+
+    def send_notifications(self, notifications):
+        self.from_worker.put({"type": "notify", "notifications": list(notifications)})
+
+    def send_message(self, channel_id, content, embed=None):
+        self.from_worker.put({"type": "send", "channel_id": channel_id, "content": content,
+                              "embed": embed.to_dict() if embed is not None else None})
+
+    async def receive(self):
+        return await asyncio.get_event_loop().run_in_executor(None, self.to_worker.get)
+
+
+# stand-ins for the few parts of a guild/channel/context the worker commands use
+class RemoteGuild():
+    def __init__(self, guild_id, name):
+        self.id = guild_id
+        self.name = name
+        self.text_channels = []
+
+    def get_channel(self, channel_id):
+        return None
+
+
+class RemoteChannel():
+    def __init__(self, link, channel_id):
+        self.link = link
+        self.id = channel_id
+
+    async def send(self, content=None, file=None, embed=None):
+        self.link.send_message(self.id, content, embed)
+
+
+class RemoteContext():
+    def __init__(self, bot, guild, channel):
+        self.bot = bot
+        self.guild = guild
+        self.channel = channel
+
+
+# entry point of the worker process
+def run_worker(to_worker, from_worker, debug):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [worker] %(message)s', datefmt='%H:%M:%S',
+                        force=True)
+
+    # imported here since lumber_bot imports this module
+    from lumber_bot import LumberBot
+
+    bot = LumberBot(command_prefix="!", debug=debug, tracker_mode="worker")
+    bot.gateway = GatewayLink(to_worker, from_worker)
+    try:
+        bot.loop.run_until_complete(serve(bot))
+    finally:
+        bot.loop.run_until_complete(bot.close())
+
+
+async def serve(bot):
+    link = bot.gateway
+    resumed = False
+
+    # the API and tracker metrics are recorded in this process, so they are served from here
+    if os.getenv("WORKER_METRICS_PORT"):
+        bot.metrics_runner = await start_metrics_server(bot.metrics_host, int(os.getenv("WORKER_METRICS_PORT")))
+
+    while True:
+        message = await link.receive()
+        if message["type"] == "stop":
+            logging.info("Tracker worker stopping.")
+            return
+
+        if message["type"] == "guilds":
+            bot.set_remote_guilds([RemoteGuild(guild_id, name) for guild_id, name in message["guilds"]])
+            # restored sessions can only be resumed once the guilds they belong to are known
+            if not resumed:
+                bot.resume_sessions()
+                resumed = True
+        elif message["type"] == "command":
+            bot.loop.create_task(run_command(bot, message))
+
+
+async def run_command(bot, message):
+    ctx = RemoteContext(bot, RemoteGuild(message["guild_id"], message["guild_name"]),
+                        RemoteChannel(bot.gateway, message["channel_id"]))
+    callback = bot.get_command(message["name"]).callback
+    # extra arguments are ignored, the same way discord.py ignores them
+    args = message["args"][:len(inspect.signature(callback).parameters) - 1]
+    try:
+        await callback(ctx, *args)
+    except Exception as e:
+        logger.exception(f"{message['name']} failed in the tracker worker: {e}")
+        await ctx.channel.send("Sorry, error occurred when invoking command.")
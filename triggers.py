@@ -0,0 +1,120 @@
+import json
+import random
+import re
+import time
+
+GREETINGS = ["hello", "hi", "hiya", "hey", "howdy",
+             "sup", "hola", "privet", "salve", "ciao",
+             "konnichiwa", "shalom"]
+
+# default trigger table. can be replaced by a JSON file with the same structure (see load_triggers)
+#   keywords: substrings that fire the trigger anywhere in the message
+#   words: whole words that fire the trigger
+#   regex: raw regex that fires the trigger (use non-capturing groups inside it)
+#   mention_only: only fire when the message starts by @ing the bot
+#   cooldown: seconds before the trigger can fire again in the same guild
+#   action: "reply" sends a message, "salute" sends a message with a salute GIF
+#   responses/response_format: a random response is picked and formatted into the message ({mention} is the author)
+DEFAULT_TRIGGERS = [
+    {
+        # check if the message @s our bot and greets it. Respond with a random greeting
+        # this allows the bot to respond regardless of punctuation or where the greeting is placed in the message
+        "name": "greeting",
+        "words": GREETINGS,
+        "mention_only": True,
+        "action": "reply",
+        "responses": GREETINGS,
+        "response_format": "{mention} {response}!"
+    },
+    {
+        "name": "trip",
+        "keywords": ["trip"],
+        "action": "salute",
+        "responses": ["trip? triple? triplexlink?"]
+    }
+]
+
+
+class Trigger():
+    def __init__(self, spec):
+        self.name = spec["name"]
+        self.keywords = spec.get("keywords", [])
+        self.words = spec.get("words", [])
+        self.regex = spec.get("regex")
+        self.mention_only = spec.get("mention_only", False)
+        self.cooldown = spec.get("cooldown", 0)
+        self.action = spec["action"]
+        self.responses = spec.get("responses", [])
+        self.response_format = spec.get("response_format", "{mention} {response}")
+
+    def pattern(self):
+        alternatives = [re.escape(keyword.lower()) for keyword in self.keywords]
+        if self.words:
+            alternatives.append(r"\b(?:" + "|".join(re.escape(word.lower()) for word in self.words) + r")\b")
+        if self.regex:
+            alternatives.append(f"(?:{self.regex})")
+        return "|".join(alternatives)
+
+    def format_response(self, mention):
+        return self.response_format.format(mention=mention, response=random.choice(self.responses))
+
+
+def load_triggers(path=None):
+    if path is None:
+        return DEFAULT_TRIGGERS
+
+    with open(path) as f:
+        return json.load(f)
+
+
+# compiles every trigger into one regex with a named group per trigger, so a message is checked against the
+# whole table in a single scan no matter how many triggers there are. each trigger's group sits in its own
+# zero-width lookahead that is tried at every position, so a match never consumes text another trigger needs
+# (e.g. "trip" and "triplexlink" both fire on "triplexlink"). mention-only triggers are left out of the regex
+# used for messages that don't @ the bot. matching is done on lowercased content
+class TriggerEngine():
+    def __init__(self, trigger_specs, mention_id):
+        self.mention_id = mention_id
+        self.triggers = {}
+        for i, spec in enumerate(trigger_specs):
+            self.triggers[f"t{i}"] = Trigger(spec)
+
+        self.matcher = self._compile(self.triggers)
+        self.unmentioned_matcher = self._compile({group: trigger for group, trigger in self.triggers.items()
+                                                  if not trigger.mention_only})
+        self.last_fired = {}  # (guild ID, trigger name) -> time it last fired
+
+    # returns the triggers fired by the message, in table order
+    def match(self, content, guild_id=None):
+        mentioned = self.mention_id is not None and content.startswith(self.mention_id)
+        matcher = self.matcher if mentioned else self.unmentioned_matcher
+        if matcher is None:
+            return []
+
+        groups = set()
+        for match in matcher.finditer(content):
+            if match.lastindex is not None:  # most positions match none of the triggers
+                groups.update(group for group, value in match.groupdict().items() if value is not None)
+        if not groups:
+            return []
+
+        now = time.monotonic()
+        fired = []
+        for group, trigger in self.triggers.items():
+            if group not in groups:
+                continue
+
+            if trigger.cooldown:
+                key = (guild_id, trigger.name)
+                if now - self.last_fired.get(key, -trigger.cooldown) < trigger.cooldown:
+                    continue
+                self.last_fired[key] = now
+
+            fired.append(trigger)
+
+        return fired
+
+    def _compile(self, triggers):
+        if not triggers:
+            return None
+        return re.compile("".join(f"(?:(?=(?P<{group}>{trigger.pattern()}))|)" for group, trigger in triggers.items()))